@@ -138,10 +138,37 @@ from db import (
     get_validator_stats,
     get_user_counts_by_role,
     get_recently_active_validators,
+    get_pool_stats,
+    get_heartbeat_stats,
 )
 
+from corpus_cache import get_corpus_cache_stats, get_context_cache_stats, invalidate_corpus
+from write_queue import get_write_queue_stats
+from live_stats import get_live_snapshot, resync_live_stats
+from leaderboard import get_leaderboard, reload_leaderboard
+from config import LIVE_REFRESH_SECONDS, LEADERBOARD_SIZE
 from validator_dashboard import render_history_for_user  # ✅ reuse history UI
 
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def _live_processing_panel():
+    # Reruns on its own every LIVE_REFRESH_SECONDS from in-memory state; no DB queries.
+    try:
+        rows = get_live_snapshot()
+    except Exception as e:
+        # not seeded; the next refresh tries again
+        st.error(f"Could not load validator progress: {e}")
+        return
+    col1, col2 = st.columns(2)
+    col1.metric("Active Now", sum(1 for v in rows if v["per_minute"] > 0))
+    col2.metric("Classifications / min", f"{sum(v['per_minute'] for v in rows):.1f}")
+    for v in rows:
+        last_id = v["last_command_id"] or 0
+        st.markdown(
+            f"**👨‍💻 {v['name']}** — Currently at Command ID: `{last_id}` | Remaining: `{v['remaining']}`"
+            f" | `{v['per_minute']:.1f}`/min")
+    st.caption(f"Updated {datetime.now():%H:%M:%S}")
+
 def admin_dashboard():
     st.set_page_config(page_title="Admin Dashboard", layout="wide")
     user = st.session_state.user
@@ -157,6 +184,7 @@ def admin_dashboard():
         "🔄 Live Command Processing": "Live Command Processing",
         "🕒 Recently Active Validators": "Recently Active Validators",
         "🏆 Leaderboard": "Leaderboard",
+        "⚙️ System": "System",
         "🚪 Logout": "Logout"
     }
 
@@ -230,14 +258,10 @@ def admin_dashboard():
 
     elif page == "Live Command Processing":
         st.subheader(" Live Command Processing")
-        validators = get_all_validators()
         st.markdown("####  Active Validators and Their Command Status")
-        for v in validators:
-            stats = get_validator_stats(v["id"])
-            remaining = stats["remaining"]
-            last_id = stats["processed"]
-            st.markdown(
-                f"**👨‍💻 {v['name']}** — Currently at Command ID: `{last_id}` | Remaining: `{remaining}`")
+        if st.button("🔄 Resync from database", key="btn_live_resync"):
+            resync_live_stats()
+        _live_processing_panel()
 
     elif page == "Recently Active Validators":
         st.subheader(" Recently Active Validators")
@@ -266,9 +290,71 @@ def admin_dashboard():
 
     elif page == "Leaderboard":
         st.subheader("🏆 Top Validators")
-        validators = get_all_validators()
-        leaderboard = [(v["name"], get_validator_stats(v["id"])["processed"]) for v in validators]
-        sorted_lb = sorted(leaderboard, key=lambda x: x[1], reverse=True)
-
-        for i, (name, score) in enumerate(sorted_lb, 1):
+        windows = {"All time": "all", "Today": "today", "This week": "week"}
+        col1, col2 = st.columns([3, 1])
+        label = col1.radio("Period", list(windows), horizontal=True, key="leaderboard_window")
+        if col2.button("🔄 Reload", key="btn_leaderboard_reload"):
+            reload_leaderboard()
+
+        try:
+            leaders = get_leaderboard(LEADERBOARD_SIZE, windows[label])
+        except Exception as e:
+            st.error(f"Could not load the leaderboard: {e}")
+            leaders = []
+        for i, (name, score) in enumerate(leaders, 1):
             st.markdown(f"**{i}. {name}** —  `{score}` commands")
+
+    elif page == "System":
+        st.subheader("⚙️ System")
+
+        st.markdown("####  DB Connection Pool")
+        pool = get_pool_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Open / Size", f"{pool['open']} / {pool['size']}")
+        col2.metric("In Use", pool["in_use"])
+        col3.metric("Hit Rate", f"{pool['hit_rate']:.0%}")
+        col4.metric("Avg Wait", f"{pool['avg_wait_ms']:.1f} ms")
+        st.json(pool)
+
+        st.markdown("####  Command Corpus Cache")
+        cache = get_corpus_cache_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Commands", cache["commands"])
+        col2.metric("Memory", f"{cache['bytes'] / (1024 * 1024):.1f} MB")
+        col3.metric("Hit Rate", f"{cache['hit_rate']:.0%}")
+        col4.metric("Hits / Misses", f"{cache['hits']} / {cache['misses']}")
+        if st.button("♻️ Reload corpus", key="btn_invalidate_corpus"):
+            invalidate_corpus()
+            st.rerun()
+        st.json(cache)
+
+        st.markdown("####  Command Context Cache")
+        ctx_cache = get_context_cache_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Commands", ctx_cache["commands"])
+        col2.metric("Memory", f"{ctx_cache['bytes'] / (1024 * 1024):.1f} / {ctx_cache['max_bytes'] / (1024 * 1024):.0f} MB")
+        col3.metric("Hit Rate", f"{ctx_cache['hit_rate']:.0%}")
+        col4.metric("Evictions", ctx_cache["evictions"])
+
+        st.markdown("####  Classification Write Queue")
+        wq = get_write_queue_stats()
+        if wq["enabled"]:
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Queue Depth", wq["depth"])
+            col2.metric("Oldest Pending", f"{wq['oldest_pending_s']:.1f} s")
+            col3.metric("Avg Flush", f"{wq['avg_flush_ms']:.1f} ms")
+            col4.metric("Retries / Rejected", f"{wq['errors']} / {wq['rejected']}")
+            if wq["rejected"]:
+                st.error(f"{wq['rejected']} classification click(s) were rejected by MySQL and are not in the "
+                         f"database. They are kept in `{wq['rejected_file']}`; last error: {wq['last_error']}")
+        else:
+            st.caption("Write-behind disabled: clicks are written synchronously.")
+        st.json(wq)
+
+        st.markdown("####  last_seen Heartbeats")
+        hb = get_heartbeat_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Pending Users", hb["pending"])
+        col2.metric("Beats / Rows Written", f"{hb['beats']} / {hb['rows']}")
+        col3.metric("Flush Every", f"{hb['interval_s']} s")
+        col4.metric("Errors", hb["errors"])
@@ -0,0 +1,74 @@
+import threading
+
+import db
+from write_queue import unsettled_classifications
+
+
+def event_key(event):
+    return event["user_id"], event["event_id"]
+
+
+class ColdStart:
+    """
+    Loads an in-memory view of the classifications (live_stats.LiveMonitor,
+    leaderboard.Leaderboard) from MySQL while CLASSIFIED events keep arriving, so that
+    every click is counted exactly once.
+
+    While run() loads, the owner's on_classified passes each event to offer(), which
+    buffers it. The view is read in one MySQL snapshot together with the candidate clicks
+    that snapshot already holds: the buffered ones plus write_queue's unsettled clicks
+    (queued but maybe unwritten, or written but not yet published). Candidates missing from
+    the snapshot are replayed on top of the view. Those it holds are remembered, so a
+    publish that arrives after the load is not applied twice.
+    """
+
+    def __init__(self, lock):
+        self._lock = lock                    # the owner's lock; offer() and apply run under it
+        self._load_lock = threading.Lock()   # one load at a time
+        self._buffer = None                  # events received during the load, None when idle
+        self._seen = set()                   # keys the last load already counted
+
+    def offer(self, event):
+        """Caller holds the lock. True when the owner should apply the event now."""
+        if self._buffer is not None:
+            self._buffer.append(event)
+            return False
+        return event_key(event) not in self._seen
+
+    def run(self, needed, read, apply):
+        """
+        Loads when needed() is true (checked under the lock): read(cursor) runs inside
+        db.read_with_stored_events, then apply(result, replay) runs under the lock with the
+        events to count on top of the result. Errors from read propagate and leave the
+        owner as it was.
+        """
+        with self._load_lock:
+            with self._lock:
+                if not needed():
+                    return
+                self._buffer = []
+            # queued clicks published before the buffer opened that may not be written yet
+            queued_before, _ = unsettled_classifications()
+
+            def candidates():
+                with self._lock:
+                    buffered = list(self._buffer)
+                queued, writing = unsettled_classifications()
+                return [event_key(e) for e in queued_before + queued + writing + buffered]
+
+            try:
+                result, stored = db.read_with_stored_events(read, candidates)
+            except Exception:
+                with self._lock:
+                    self._buffer = None
+                raise
+
+            with self._lock:
+                replay = {}
+                for event in queued_before + self._buffer:
+                    key = event_key(event)
+                    if key not in stored:
+                        replay.setdefault(key, event)
+                self._buffer = None
+                self._seen = stored | set(replay)
+                apply(result, list(replay.values()))
@@ -1,4 +1,55 @@
+import os
+
 DB_HOST = "localhost"
 DB_USER = "root"
 DB_PASSWORD = "Raviraj@10"
-DB_NAME = "rule_validation"
\ No newline at end of file
+DB_NAME = "rule_validation"
+
+# Connection pool (shared by all sessions in the Streamlit process)
+DB_POOL_SIZE = 20              # max open connections
+DB_POOL_TIMEOUT = 10           # seconds to wait for a free connection
+DB_POOL_MAX_LIFETIME = 1800    # seconds before a connection is recycled
+DB_POOL_PING_INTERVAL = 30     # ping connections idle longer than this before reuse
+
+# Validator dashboard: commands kept in session on each side of the current one
+QUEUE_PREFETCH = 5
+
+# Shared command corpus cache (one copy per process, shared by all sessions).
+# Set CORPUS_CACHE_ENABLED = False to page straight from MySQL when the corpus is too big for memory.
+CORPUS_CACHE_ENABLED = True
+CORPUS_CACHE_TTL = 60          # seconds before re-checking the corpus version
+CONTEXT_CACHE_MAX_BYTES = 64 * 1024 * 1024   # LRU of command contexts for the history detail view
+
+# Validator history: rows per "Load more" page, and filter combinations cached per session
+HISTORY_PAGE_SIZE = 200
+HISTORY_CACHED_FILTERS = 5
+
+# importer.py: rules per executemany batch / transaction
+IMPORT_CHUNK_SIZE = 5000
+
+# Runtime files live under the app's data/ directory whatever the working directory is
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Rule decisions (Approved / Partially Correct / Rejected), append-only SQLite log
+DECISION_LOG_PATH = os.path.join(DATA_DIR, "decisions.sqlite3")
+
+# Write-behind queue for classification clicks: acknowledged once appended to the local WAL,
+# written to MySQL in batches by a background thread. False = write synchronously per click.
+WRITE_BEHIND_ENABLED = True
+WRITE_BEHIND_WAL = os.path.join(DATA_DIR, "classifications.wal")
+WRITE_BEHIND_BATCH_SIZE = 500
+WRITE_BEHIND_FLUSH_INTERVAL = 1.0   # seconds between flushes while clicks are arriving
+
+# last_seen heartbeats are coalesced in memory and written in one UPDATE this often (seconds)
+HEARTBEAT_FLUSH_INTERVAL = 15
+
+# Admin live page: refresh interval and the window classifications/minute is measured over (seconds)
+LIVE_REFRESH_SECONDS = 5
+LIVE_THROUGHPUT_WINDOW = 300
+
+# Admin leaderboard: validators shown per window
+LEADERBOARD_SIZE = 25
+
+# Seconds a user profile row stays cached for role checks (logins always read MySQL), i.e.
+# how long a role changed directly in the database can take to apply
+USER_CACHE_TTL = 60
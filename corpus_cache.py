@@ -0,0 +1,260 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from config import CORPUS_CACHE_TTL, CONTEXT_CACHE_MAX_BYTES
+from db import iter_corpus_rows, get_corpus_version, get_command_arguments
+
+
+class CorpusSnapshot:
+    """
+    Read-only, precomputed index of the commands/arguments/contexts join, built once per
+    corpus version and shared by reference by every session in the process.
+
+    Arguments are stored column-wise in command order; `_offsets[i]:_offsets[i + 1]` is the
+    argument range of the i-th command, and `_ordinal` maps command_id -> i. Looking up a
+    command's arguments or its neighbours is O(1) in the corpus size.
+
+    Offers the same queue API as db.py (get_command_ids_from, get_command_ids_before,
+    get_command_arguments) so the dashboard can use either.
+    """
+
+    def __init__(self, version, rows):
+        self.version = version
+        command_ids = array("q")
+        offsets = array("q")
+        arg_ids = array("q")
+        lines = []
+        contexts = []
+        for cmd_id, arg_id, line, context in rows:   # ordered by command_id, argument_id
+            if not command_ids or command_ids[-1] != cmd_id:
+                command_ids.append(cmd_id)
+                offsets.append(len(arg_ids))
+            arg_ids.append(arg_id)
+            lines.append(line)
+            contexts.append(context)
+        offsets.append(len(arg_ids))
+
+        self.command_ids = command_ids
+        self._ordinal = {cmd_id: i for i, cmd_id in enumerate(command_ids)}
+        self._offsets = offsets
+        self._arg_ids = arg_ids
+        self._lines = lines
+        self._contexts = contexts
+        self.row_count = len(arg_ids)
+        self.nbytes = _estimate_bytes(self)
+
+    def _position(self, cmd_id):
+        """Ordinal of cmd_id, or of the first command after it when it is not in the corpus."""
+        pos = self._ordinal.get(cmd_id)
+        return pos if pos is not None else bisect_left(self.command_ids, cmd_id)
+
+    def arguments(self, position):
+        """Argument rows of the command at `position`."""
+        cmd_id = self.command_ids[position]
+        return tuple(
+            {
+                "argument_id": self._arg_ids[i],
+                "command_id": cmd_id,
+                "full_command_line": self._lines[i],
+                "context_lines": self._contexts[i],
+            }
+            for i in range(self._offsets[position], self._offsets[position + 1])
+        )
+
+    def get_command_ids_from(self, cmd_id, limit):
+        start = self._position(cmd_id)
+        return list(self.command_ids[start:start + limit])
+
+    def get_command_ids_before(self, cmd_id, limit):
+        end = self._position(cmd_id)
+        return list(self.command_ids[max(0, end - limit):end])
+
+    def get_command_arguments(self, cmd_ids):
+        result = {}
+        for cmd_id in cmd_ids:
+            pos = self._ordinal.get(cmd_id)
+            result[cmd_id] = self.arguments(pos) if pos is not None else ()
+        return result
+
+
+def _estimate_bytes(snapshot):
+    total = sum(sys.getsizeof(col) for col in (
+        snapshot.command_ids, snapshot._ordinal, snapshot._offsets,
+        snapshot._arg_ids, snapshot._lines, snapshot._contexts,
+    ))
+    total += sum(sys.getsizeof(line) for line in snapshot._lines)
+    total += sum(sys.getsizeof(ctx) for ctx in snapshot._contexts)
+    return total
+
+
+class CorpusCache:
+    """
+    Holds one CorpusSnapshot per process. After `ttl` seconds the cheap corpus version
+    query is re-run; the corpus is only reloaded when the version changed or after
+    invalidate(). Concurrent callers wait for a single reload instead of each running it.
+    """
+
+    def __init__(self, loader, version_fn, ttl):
+        self._loader = loader
+        self._version_fn = version_fn
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._stats = {"hits": 0, "misses": 0, "revalidations": 0, "invalidations": 0}
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self._ttl:
+            self._stats["hits"] += 1
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - self._checked_at < self._ttl:
+                self._stats["hits"] += 1
+                return snapshot
+
+            version = self._version_fn()
+            if snapshot is not None and snapshot.version == version:
+                self._stats["revalidations"] += 1
+            else:
+                self._stats["misses"] += 1
+                snapshot = CorpusSnapshot(version, self._loader())
+                self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        stats = dict(self._stats)
+        snapshot = self._snapshot
+        stats["loaded"] = snapshot is not None
+        stats["version"] = snapshot.version if snapshot else None
+        stats["commands"] = len(snapshot.command_ids) if snapshot else 0
+        stats["rows"] = snapshot.row_count if snapshot else 0
+        stats["bytes"] = snapshot.nbytes if snapshot else 0
+        stats["age_s"] = round(time.monotonic() - self._checked_at, 1) if snapshot else None
+        lookups = stats["hits"] + stats["revalidations"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["revalidations"]) / lookups if lookups else 0.0
+        return stats
+
+
+class ContextCache:
+    """
+    LRU of per-command argument/context rows, bounded by estimated bytes rather than entry
+    count. get_many() serves what it holds and loads all misses with one batch query.
+    Everything is dropped when the corpus version changes (checked at most every `ttl` seconds).
+    """
+
+    def __init__(self, loader, version_fn, max_bytes, ttl):
+        self._loader = loader
+        self._version_fn = version_fn
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._version_lock = threading.Lock()   # one version query at a time
+        self._entries = OrderedDict()   # cmd_id -> (rows, nbytes)
+        self._bytes = 0
+        self._version = None
+        self._checked_at = 0.0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "batches": 0}
+
+    def _check_version(self):
+        if time.monotonic() - self._checked_at < self._ttl:
+            return
+        with self._version_lock:
+            # callers that waited here find it already refreshed
+            if time.monotonic() - self._checked_at < self._ttl:
+                return
+            version = self._version_fn()
+            with self._lock:
+                if version != self._version:
+                    self._entries.clear()
+                    self._bytes = 0
+                    self._version = version
+                self._checked_at = time.monotonic()
+
+    def get_many(self, cmd_ids):
+        self._check_version()
+        found = {}
+        missing = []
+        with self._lock:
+            for cmd_id in dict.fromkeys(cmd_ids):
+                entry = self._entries.get(cmd_id)
+                if entry is None:
+                    missing.append(cmd_id)
+                else:
+                    self._entries.move_to_end(cmd_id)
+                    found[cmd_id] = entry[0]
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(missing)
+
+        if missing:
+            loaded = self._loader(missing)
+            with self._lock:
+                self._stats["batches"] += 1
+                for cmd_id, rows in loaded.items():
+                    rows = tuple(rows)
+                    found[cmd_id] = rows
+                    self._put(cmd_id, rows)
+        return found
+
+    def _put(self, cmd_id, rows):
+        nbytes = sum(
+            sys.getsizeof(row) + sys.getsizeof(row["full_command_line"]) + sys.getsizeof(row["context_lines"])
+            for row in rows
+        )
+        old = self._entries.pop(cmd_id, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[cmd_id] = (rows, nbytes)
+        self._bytes += nbytes
+        while self._bytes > self._max_bytes and len(self._entries) > 1:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["commands"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["max_bytes"] = self._max_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = CorpusCache(iter_corpus_rows, get_corpus_version, CORPUS_CACHE_TTL)
+
+def get_corpus():
+    """Shared corpus snapshot for this process (reloaded only when the corpus changes)."""
+    return _cache.get()
+
+def invalidate_corpus():
+    """Drop the cached corpus, e.g. right after importing new commands."""
+    _cache.invalidate()
+
+def get_corpus_cache_stats():
+    return _cache.stats()
+
+_contexts = ContextCache(get_command_arguments, get_corpus_version, CONTEXT_CACHE_MAX_BYTES, CORPUS_CACHE_TTL)
+
+def get_command_contexts(cmd_ids):
+    """
+    { command_id: ({'argument_id', 'command_id', 'full_command_line', 'context_lines'}, ...) }
+    from the shared LRU; all uncached commands are fetched in one IN query.
+    """
+    return _contexts.get_many(cmd_ids)
+
+def get_context_cache_stats():
+    return _contexts.stats()
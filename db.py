@@ -1,10 +1,21 @@
+import threading
+import time
+from datetime import datetime
 import mysql.connector
-from config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+from config import (
+    DB_HOST, DB_USER, DB_PASSWORD, DB_NAME,
+    DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_LIFETIME, DB_POOL_PING_INTERVAL,
+    HEARTBEAT_FLUSH_INTERVAL, USER_CACHE_TTL,
+)
+from db_pool import ConnectionPool
+from heartbeat import HeartbeatAggregator
 import hashlib
+import hmac
 
 # ---------------------- CONNECTION ------------------------
 
 def get_connection():
+    """Opens a new, unpooled connection. App code should use `connection()` instead."""
     return mysql.connector.connect(
         host=DB_HOST,
         user=DB_USER,
@@ -12,241 +23,906 @@ def get_connection():
         database=DB_NAME
     )
 
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Process-wide pool, created on first use (modules are imported once per Streamlit process)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_connection,
+                    size=DB_POOL_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    ping_interval=DB_POOL_PING_INTERVAL,
+                )
+    return _pool
+
+def connection():
+    """
+    Borrow a pooled connection:
+
+        with connection() as conn:
+            cursor = conn.cursor()
+            ...
+
+    The connection is rolled back and returned to the pool on exit.
+    """
+    return get_pool().connection()
+
+def get_pool_stats():
+    return get_pool().stats()
+
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
-# ---------------------- AUTH ------------------------
+# ---------------------- SCHEMA ------------------------
 
-def signup_user(name, email, password):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        # Create user with validator role
-        cursor.execute(
-            "INSERT INTO users (name, email, password, role) VALUES (%s, %s, %s, %s)",
-            (name, email, hash_password(password), 'validator')
-        )
+_SCHEMA = [
+    # Corpus tables are normally created out of band; these are the columns the app relies on
+    # (importer.py adds dedup keys through _COLUMNS below).
+    """
+    CREATE TABLE IF NOT EXISTS commands (
+        id INT NOT NULL AUTO_INCREMENT PRIMARY KEY
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS arguments (
+        id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        command_id INT NOT NULL,
+        full_command_line TEXT,
+        KEY idx_arguments_command (command_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS contexts (
+        id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        argument_id INT NOT NULL,
+        context_lines MEDIUMTEXT,
+        KEY idx_contexts_argument (argument_id)
+    )
+    """,
+    # Single row bumped by every corpus write (importer.py, db_tools.py), so get_corpus_version()
+    # notices edits that leave the max ids alone.
+    """
+    CREATE TABLE IF NOT EXISTS corpus_version (
+        id TINYINT NOT NULL PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    # One row per "Mark as Dynamic/Static" click, for every validator.
+    # user_id is part of the primary key so the table can be PARTITION BY HASH(user_id) later.
+    """
+    CREATE TABLE IF NOT EXISTS classifications (
+        id BIGINT NOT NULL AUTO_INCREMENT,
+        user_id INT NOT NULL,
+        command_id INT NOT NULL,
+        argument_id INT NULL,
+        action ENUM('Dynamic', 'Static') NOT NULL,
+        command_text TEXT,
+        processed_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, user_id),
+        KEY idx_cls_user_time (user_id, processed_time),
+        KEY idx_cls_history (user_id, command_id, processed_time, id, action)
+    )
+    """,
+    # Per-validator counters maintained by every classification write, so admin pages read
+    # one primary-key row per validator. reconcile_validator_stats() rebuilds them from raw rows.
+    # last_seen is also advanced by the heartbeat flush; it replaces users.last_seen, which is
+    # no longer written and only read by the reconcile as a floor for old accounts.
+    """
+    CREATE TABLE IF NOT EXISTS validator_stats (
+        user_id INT NOT NULL PRIMARY KEY,
+        dynamic INT NOT NULL DEFAULT 0,
+        static INT NOT NULL DEFAULT 0,
+        last_command_id INT NULL,
+        last_seen TIMESTAMP NULL
+    )
+    """,
+]
+
+# Columns added to pre-existing tables: (table, column, definition)
+_COLUMNS = [
+    # Progress cursor: last_processed_cmd_id holds the last classified command_id and this
+    # its argument. NULL marks a legacy row whose last_processed_cmd_id is still a list
+    # position (see `python db_tools.py convert-progress`).
+    ("users", "last_processed_arg_id", "INT NULL"),
+    # CONTEXT_RAW rows still hold the escaped "\\n" text; CONTEXT_NORMALIZED rows are stored
+    # ready to display (see `python db_tools.py normalize-contexts`).
+    ("contexts", "context_format", "TINYINT NOT NULL DEFAULT 0"),
+    # importer.py: hash of the normalized command text / of (command, full_command_line),
+    # so re-importing a file never duplicates commands or arguments.
+    ("commands", "command_key", "CHAR(32) NULL"),
+    ("commands", "command_text", "TEXT NULL"),
+    ("arguments", "line_key", "CHAR(32) NULL"),
+    # write_queue.py: id of the queued click, so replaying the local WAL never double-inserts
+    ("classifications", "event_id", "CHAR(32) NULL"),
+]
+
+# Indexes added to pre-existing tables: (table, index, columns, kind)
+_INDEXES = [
+    # History list: user filter + ORDER BY command_id, processed_time, id keyset pages; the
+    # date and type filters are checked inside the index before any row is read. Its
+    # (user_id, command_id) prefix also serves get_resume_command_id's NOT EXISTS probe.
+    ("classifications", "idx_cls_history", "(user_id, command_id, processed_time, id, action)", "INDEX"),
+    # Corpus joins (commands -> arguments -> contexts); corpus tables that predate _SCHEMA
+    # have no keys on these columns
+    ("arguments", "idx_arguments_command", "(command_id)", "INDEX"),
+    ("contexts", "idx_contexts_argument", "(argument_id)", "INDEX"),
+    ("commands", "uq_commands_key", "(command_key)", "UNIQUE INDEX"),
+    ("arguments", "uq_arguments_line_key", "(line_key)", "UNIQUE INDEX"),
+    # user_id first: every unique key must contain the partitioning column for PARTITION BY HASH(user_id)
+    ("classifications", "uq_cls_user_event", "(user_id, event_id)", "UNIQUE INDEX"),
+    # Login looks users up by email alone
+    ("users", "uq_users_email", "(email)", "UNIQUE INDEX"),
+]
+
+# Indexes dropped once their replacement above exists: (table, index, replaced by)
+_DROPPED_INDEXES = [
+    # idx_cls_history starts with the same (user_id, command_id) prefix
+    ("classifications", "idx_cls_user_cmd", "idx_cls_history"),
+    # single-column predecessor of uq_cls_user_event; it would block PARTITION BY HASH(user_id)
+    ("classifications", "uq_cls_event", "uq_cls_user_event"),
+]
+
+_schema_ready = False
+
+def _has_index(cursor, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+def _ensure_indexes(cursor):
+    for table, index, columns, kind in _INDEXES:
+        if not _has_index(cursor, table, index):
+            try:
+                cursor.execute(f"CREATE {kind} {index} ON {table} {columns}")
+            except mysql.connector.Error as e:
+                # e.g. duplicate emails block uq_users_email; the app still works without it
+                print(f"Error creating index {index} on {table}:", e)
+    for table, index, replacement in _DROPPED_INDEXES:
+        if _has_index(cursor, table, index) and _has_index(cursor, table, replacement):
+            cursor.execute(f"DROP INDEX {index} ON {table}")
+
+def _ensure_columns(cursor):
+    for table, column, definition in _COLUMNS:
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        """, (table, column))
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def init_schema():
+    """Creates the shared tables if missing. Runs its DDL once per process."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with connection() as conn:
+        cursor = conn.cursor()
+        for ddl in _SCHEMA:
+            cursor.execute(ddl)
+        _ensure_columns(cursor)
+        _ensure_indexes(cursor)
+        cursor.execute("INSERT IGNORE INTO corpus_version (id, version) VALUES (1, 0)")
         conn.commit()
 
-        cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-        user_id = cursor.fetchone()[0]
+        # First run against existing data: seed the counters
+        cursor.execute("SELECT 1 FROM validator_stats LIMIT 1")
+        seeded = cursor.fetchone() is not None
+        cursor.close()
+    if not seeded:
+        reconcile_validator_stats()
+    _schema_ready = True
 
-        # Create validator-specific tables
-        cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS dynamic_cmds_user_{user_id} (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                command_id INT,
-                command_text TEXT,
-                processed_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS static_cmds_user_{user_id} (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                command_id INT,
-                command_text TEXT,
-                processed_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+# ---------------------- AUTH ------------------------
 
-        conn.commit()
-        return True
-    except mysql.connector.Error as e:
-        print("Signup Error:", e)
-        return False
-    finally:
+def signup_user(name, email, password):
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # Create user with validator role
+            cursor.execute(
+                "INSERT INTO users (name, email, password, role) VALUES (%s, %s, %s, %s)",
+                (name, email, hash_password(password), 'validator')
+            )
+            conn.commit()
+            invalidate_user(email=email)
+            return True
+        except mysql.connector.Error as e:
+            print("Signup Error:", e)
+            return False
+        finally:
+            cursor.close()
+
+# Profile rows by email and by id, kept for USER_CACHE_TTL seconds so role checks on every
+# rerun skip MySQL. Logins always read the row from MySQL (and refresh the entry), so a
+# changed password or removed account takes effect at once; a role changed outside the app
+# shows up within USER_CACHE_TTL. Writes made here (signup_user, update_user_role) call
+# invalidate_user(), which drops the entry.
+_USER_COLUMNS = "id, name, email, role, password"
+_user_cache = {}      # email (lowercase) -> (row, cached_at)
+_user_ids = {}        # id -> email (lowercase)
+_user_cache_lock = threading.Lock()
+
+def _email_key(email):
+    return (email or "").strip().lower()
+
+def _cache_user(row):
+    key = _email_key(row["email"])
+    with _user_cache_lock:
+        _user_cache[key] = (row, time.monotonic())
+        _user_ids[row["id"]] = key
+
+def _cached_user(key):
+    with _user_cache_lock:
+        entry = _user_cache.get(key)
+    if entry is not None and time.monotonic() - entry[1] < USER_CACHE_TTL:
+        return entry[0]
+    return None
+
+def _public(row):
+    return {k: v for k, v in row.items() if k != "password"}
+
+def invalidate_user(user_id=None, email=None):
+    with _user_cache_lock:
+        key = _user_ids.pop(user_id, None) if user_id is not None else None
+        for k in (key, _email_key(email) if email else None):
+            if k is not None:
+                _user_cache.pop(k, None)
+
+def _fetch_user(where, value):
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE {where} = %s", (value,))
+        row = cursor.fetchone()
         cursor.close()
-        conn.close()
+    if row is not None:
+        _cache_user(row)
+    elif where == "id":
+        invalidate_user(user_id=value)
+    else:
+        invalidate_user(email=value)  # account removed
+    return row
 
 def login_user(email, password):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT * FROM users WHERE email=%s AND password=%s",
-        (email, hash_password(password))
-    )
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    return user
+    """
+    Profile dict (id, name, email, role) when the credentials match, else None.
+    The row is always read through uq_users_email, never from the cache, and the hash
+    compared in constant time here rather than in the WHERE clause.
+    """
+    row = _fetch_user("email", _email_key(email))
+    if row is None or not hmac.compare_digest(str(row["password"]), hash_password(password)):
+        return None
+    return _public(row)
+
+def get_user(user_id):
+    """Profile dict (id, name, email, role) for role checks, served from the cache when fresh."""
+    with _user_cache_lock:
+        key = _user_ids.get(user_id)
+    row = _cached_user(key) if key is not None else None
+    row = row or _fetch_user("id", user_id)
+    return _public(row) if row else None
+
+def update_user_role(user_id, role):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET role = %s WHERE id = %s", (role, user_id))
+        conn.commit()
+        cursor.close()
+    invalidate_user(user_id)
 
 # -------------------- COMMANDS --------------------
 
+CONTEXT_RAW, CONTEXT_NORMALIZED = 0, 1
+
+def normalize_context(text):
+    """Unescapes a raw context blob ("\\n" -> newline, "\\\\" -> "\\")."""
+    return text.replace("\\n", "\n").replace("\\\\", "\\")
+
+def _context_text(text, context_format):
+    """Read path: normalized rows pass straight through, only legacy raw rows are unescaped."""
+    if text and context_format == CONTEXT_RAW:
+        return normalize_context(text)
+    return text
+
 def get_commands_with_contexts():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    query = """
-        SELECT 
-            a.id AS argument_id,
-            c.id AS command_id,
-            a.full_command_line,
-            ctx.context_lines
-        FROM commands c
-        JOIN arguments a ON c.id = a.command_id
-        LEFT JOIN contexts ctx ON ctx.argument_id = a.id
-        ORDER BY c.id;
-    """
-    cursor.execute(query)
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        query = """
+            SELECT
+                a.id AS argument_id,
+                c.id AS command_id,
+                a.full_command_line,
+                ctx.context_lines,
+                ctx.context_format
+            FROM commands c
+            JOIN arguments a ON c.id = a.command_id
+            LEFT JOIN contexts ctx ON ctx.argument_id = a.id
+            ORDER BY c.id, a.id;
+        """
+        cursor.execute(query)
+        results = cursor.fetchall()
+        cursor.close()
 
     for row in results:
-        if row["context_lines"]:
-            row["context_lines"] = row["context_lines"].replace("\\n", "\n").replace("\\\\", "\\")
+        row["context_lines"] = _context_text(row["context_lines"], row.pop("context_format"))
     return results
 
 
-def insert_dynamic_command(user_id, cmd_id, command_text):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"""
-        INSERT INTO dynamic_cmds_user_{user_id} (command_id, command_text)
-        VALUES (%s, %s)
-    """, (cmd_id, command_text))
-    update_last_seen(user_id)  # ✅ Update last seen here
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-def insert_static_command(user_id, cmd_id, command_text):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"""
-        INSERT INTO static_cmds_user_{user_id} (command_id, command_text)
-        VALUES (%s, %s)
-    """, (cmd_id, command_text))
-    update_last_seen(user_id)  # ✅ Update last seen here
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-def get_recently_active_validators():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+def iter_corpus_rows(batch_size=10000):
+    """
+    Streams (command_id, argument_id, full_command_line, context_lines) tuples ordered by
+    command_id, argument_id without materialising the whole result set as dicts.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT a.command_id, a.id, a.full_command_line, ctx.context_lines, ctx.context_format
+            FROM commands c
+            JOIN arguments a ON c.id = a.command_id
+            LEFT JOIN contexts ctx ON ctx.argument_id = a.id
+            ORDER BY a.command_id, a.id
+        """)
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            for cmd_id, arg_id, line, context, context_format in batch:
+                yield cmd_id, arg_id, line, _context_text(context, context_format)
+        cursor.close()
+
+def iter_argument_lines(after_id=0, batch_size=10000):
+    """
+    Yields lists of (argument_id, full_command_line) in id order, `batch_size` at a time.
+    Each batch is its own keyset query, so no connection is held between batches.
+    """
+    while True:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, full_command_line FROM arguments WHERE id > %s ORDER BY id LIMIT %s",
+                (after_id, batch_size)
+            )
+            batch = cursor.fetchall()
+            cursor.close()
+        if not batch:
+            return
+        yield batch
+        after_id = batch[-1][0]
+
+def get_corpus_version():
+    """
+    Fingerprint of the commands/arguments/contexts tables: their max ids (primary-key
+    lookups) plus the corpus_version counter, so its cost does not grow with the corpus.
+    Writes that remove or edit rows must call bump_corpus_version() to be noticed.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT
+                (SELECT COALESCE(MAX(id), 0) FROM commands),
+                (SELECT COALESCE(MAX(id), 0) FROM arguments),
+                (SELECT COALESCE(MAX(id), 0) FROM contexts),
+                (SELECT COALESCE(MAX(version), 0) FROM corpus_version WHERE id = 1)
+        """)
+        version = tuple(int(v) for v in cursor.fetchone())
+        cursor.close()
+    return version
+
+def bump_corpus_version(cursor):
+    """Marks the corpus changed; the caller commits it with the change itself."""
     cursor.execute("""
-        SELECT name, last_seen FROM users
-        WHERE role = 'validator'
-        ORDER BY last_seen DESC
-        LIMIT 10
+        INSERT INTO corpus_version (id, version) VALUES (1, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
     """)
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return results
+
+# A command is only queued for review if it has at least one argument.
+_QUEUED_COMMANDS = """
+    SELECT c.id FROM commands c
+    WHERE {where} EXISTS (SELECT 1 FROM arguments a WHERE a.command_id = c.id)
+    ORDER BY c.id {order}
+    LIMIT %s
+"""
+
+def _queued_command_ids(where, params, order, limit):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_QUEUED_COMMANDS.format(where=where, order=order), (*params, limit))
+        ids = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    return ids
+
+def get_resume_command_id(user_id):
+    """
+    First queued command after the user's progress cursor that the user has not classified
+    yet (falling back to the start of the queue), or None when nothing is left. A legacy
+    cursor (last_processed_arg_id NULL) holds a list position rather than a command id,
+    so the walk starts from the beginning; classified commands are skipped either way.
+    Walks commands by primary key and probes idx_cls_history, so it stays a short
+    indexed lookup however large the corpus or history grows.
+    """
+    query = """
+        SELECT c.id FROM commands c
+        WHERE c.id > %s
+          AND EXISTS (SELECT 1 FROM arguments a WHERE a.command_id = c.id)
+          AND NOT EXISTS (
+              SELECT 1 FROM classifications cl
+              WHERE cl.user_id = %s AND cl.command_id = c.id
+          )
+        ORDER BY c.id
+        LIMIT 1
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT last_processed_cmd_id, last_processed_arg_id FROM users WHERE id = %s", (user_id,)
+        )
+        row = cursor.fetchone()
+        after_id = row[0] if row and row[0] and row[1] is not None else 0
+
+        cursor.execute(query, (after_id, user_id))
+        row = cursor.fetchone()
+        if row is None and after_id:
+            cursor.execute(query, (0, user_id))
+            row = cursor.fetchone()
+        cursor.close()
+    return row[0] if row else None
+
+def get_command_ids_from(cmd_id, limit):
+    """Up to `limit` queued command ids >= cmd_id, ascending (keyset page)."""
+    return _queued_command_ids("c.id >= %s AND", (cmd_id,), "ASC", limit)
+
+def get_command_ids_before(cmd_id, limit):
+    """Up to `limit` queued command ids < cmd_id, ascending (keyset page)."""
+    return _queued_command_ids("c.id < %s AND", (cmd_id,), "DESC", limit)[::-1]
+
+def get_command_arguments(cmd_ids):
+    """
+    Arguments and contexts for the given commands only:
+    { command_id: [{'argument_id', 'command_id', 'full_command_line', 'context_lines'}, ...] }
+    """
+    grouped = {cmd_id: [] for cmd_id in cmd_ids}
+    if not cmd_ids:
+        return grouped
+    placeholders = ", ".join(["%s"] * len(cmd_ids))
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"""
+            SELECT
+                a.id AS argument_id,
+                a.command_id,
+                a.full_command_line,
+                ctx.context_lines,
+                ctx.context_format
+            FROM arguments a
+            LEFT JOIN contexts ctx ON ctx.argument_id = a.id
+            WHERE a.command_id IN ({placeholders})
+            ORDER BY a.command_id, a.id
+        """, tuple(cmd_ids))
+        for row in cursor.fetchall():
+            row["context_lines"] = _context_text(row["context_lines"], row.pop("context_format"))
+            grouped[row["command_id"]].append(row)
+        cursor.close()
+    return grouped
+
+def _insert_classification(cursor, user_id, cmd_id, argument_id, command_text, action,
+                           event_id=None, processed_time=None):
+    """Inserts the row and bumps validator_stats; the caller commits both together."""
+    processed_time = processed_time or datetime.now()
+    cursor.execute("""
+        INSERT INTO classifications (event_id, user_id, command_id, argument_id, action, command_text, processed_time)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (event_id, user_id, cmd_id, argument_id, action, command_text, processed_time))
+    is_dynamic = 1 if action == "Dynamic" else 0
+    cursor.execute("""
+        INSERT INTO validator_stats (user_id, dynamic, static, last_command_id, last_seen)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            dynamic = dynamic + VALUES(dynamic),
+            static = static + VALUES(static),
+            last_command_id = VALUES(last_command_id),
+            last_seen = GREATEST(COALESCE(last_seen, VALUES(last_seen)), VALUES(last_seen))
+    """, (user_id, is_dynamic, 1 - is_dynamic, cmd_id, processed_time))
+
+def insert_dynamic_command(user_id, cmd_id, command_text, argument_id=None, event_id=None, processed_time=None):
+    with connection() as conn:
+        cursor = conn.cursor()
+        _insert_classification(cursor, user_id, cmd_id, argument_id, command_text, "Dynamic",
+                               event_id, processed_time)
+        conn.commit()
+        cursor.close()
+    update_last_seen(user_id)
+
+def insert_static_command(user_id, cmd_id, command_text, argument_id=None, event_id=None, processed_time=None):
+    with connection() as conn:
+        cursor = conn.cursor()
+        _insert_classification(cursor, user_id, cmd_id, argument_id, command_text, "Static",
+                               event_id, processed_time)
+        conn.commit()
+        cursor.close()
+    update_last_seen(user_id)
+
+def record_classification(user_id, cmd_id, argument_id, command_text, action, event_id=None, processed_time=None):
+    """
+    Records one "Mark as Dynamic/Static" click: the classification row, the validator_stats
+    counters and last_seen, and the progress cursor (last_processed_cmd_id /
+    last_processed_arg_id) are written on one connection and committed together. `action` is "Dynamic" or "Static"; `event_id`
+    identifies the click for readers that dedupe (see stored_event_keys).
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            _insert_classification(cursor, user_id, cmd_id, argument_id, command_text, action,
+                                   event_id, processed_time)
+            cursor.execute(
+                """
+                UPDATE users
+                SET last_processed_cmd_id = %s, last_processed_arg_id = %s
+                WHERE id = %s
+                """,
+                (cmd_id, argument_id, user_id)
+            )
+            conn.commit()
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+def write_classifications(events):
+    """
+    Applies a batch of queued clicks (dicts with event_id, user_id, command_id, argument_id,
+    command_text, action, processed_time) in one transaction: the rows, the validator_stats
+    counters and each user's progress cursor (last_seen goes through update_last_seen).
+    Events whose (user_id, event_id) is already stored are skipped, so a batch can be
+    retried or replayed safely. Returns rows written.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            done = stored_event_keys(cursor, [(e["user_id"], e["event_id"]) for e in events])
+            fresh = [e for e in events if (e["user_id"], e["event_id"]) not in done]
+            if fresh:
+                cursor.executemany("""
+                    INSERT INTO classifications
+                        (event_id, user_id, command_id, argument_id, action, command_text, processed_time)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, [(e["event_id"], e["user_id"], e["command_id"], e["argument_id"], e["action"],
+                       e["command_text"], e["processed_time"]) for e in fresh])
+
+                # one counter upsert and one cursor update per user; events are in click order
+                per_user = {}
+                for e in fresh:
+                    totals = per_user.setdefault(e["user_id"], {"dynamic": 0, "static": 0})
+                    totals["dynamic" if e["action"] == "Dynamic" else "static"] += 1
+                    totals["last"] = e
+                cursor.executemany("""
+                    INSERT INTO validator_stats (user_id, dynamic, static, last_command_id, last_seen)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        dynamic = dynamic + VALUES(dynamic),
+                        static = static + VALUES(static),
+                        last_command_id = VALUES(last_command_id),
+                        last_seen = GREATEST(COALESCE(last_seen, VALUES(last_seen)), VALUES(last_seen))
+                """, [(user_id, t["dynamic"], t["static"], t["last"]["command_id"], t["last"]["processed_time"])
+                      for user_id, t in per_user.items()])
+                cursor.executemany("""
+                    UPDATE users SET last_processed_cmd_id = %s, last_processed_arg_id = %s
+                    WHERE id = %s
+                """, [(t["last"]["command_id"], t["last"]["argument_id"], user_id)
+                      for user_id, t in per_user.items()])
+            conn.commit()
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    return len(fresh)
+
+def stored_event_keys(cursor, keys, chunk_size=500):
+    """The (user_id, event_id) pairs of `keys` that are already in classifications (uq_cls_user_event)."""
+    keys = list(dict.fromkeys(keys))
+    found = set()
+    for i in range(0, len(keys), chunk_size):
+        chunk = keys[i:i + chunk_size]
+        cursor.execute(
+            "SELECT user_id, event_id FROM classifications WHERE (user_id, event_id) IN ("
+            + ", ".join(["(%s, %s)"] * len(chunk)) + ")",
+            [v for key in chunk for v in key]
+        )
+        found.update((row[0], row[1]) for row in cursor.fetchall())
+    return found
+
+def read_with_stored_events(read, candidates):
+    """
+    Runs read(cursor) and then stored_event_keys() for candidates() in one read-only
+    transaction with a consistent snapshot, so both answers describe the same instant.
+    Returns (read's result, stored keys). Used to seed in-memory views (cold_start.py).
+    """
+    with connection() as conn:
+        conn.start_transaction(consistent_snapshot=True, isolation_level="REPEATABLE READ", readonly=True)
+        cursor = conn.cursor(dictionary=True)
+        keys_cursor = conn.cursor()
+        try:
+            result = read(cursor)
+            stored = stored_event_keys(keys_cursor, candidates())
+        finally:
+            cursor.close()
+            keys_cursor.close()
+    return result, stored
+
+def get_recently_active_validators(limit=10):
+    """
+    The `limit` validators seen most recently (validator_stats.last_seen), with heartbeats
+    not yet flushed merged in, so the list is current without a write per click.
+    """
+    pending = get_heartbeats().pending()
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT u.id, u.name, vs.last_seen
+            FROM users u
+            LEFT JOIN validator_stats vs ON vs.user_id = u.id
+            WHERE u.role = 'validator'
+            ORDER BY vs.last_seen DESC
+            LIMIT %s
+        """, (limit,))
+        rows = {row["id"]: row for row in cursor.fetchall()}
+        # users active since the last flush may not be in the top rows yet
+        missing = [user_id for user_id in pending if user_id not in rows]
+        if missing:
+            cursor.execute(
+                "SELECT u.id, u.name, vs.last_seen FROM users u "
+                "LEFT JOIN validator_stats vs ON vs.user_id = u.id "
+                f"WHERE u.role = 'validator' AND u.id IN ({', '.join(['%s'] * len(missing))})",
+                missing
+            )
+            rows.update((row["id"], row) for row in cursor.fetchall())
+        cursor.close()
+
+    for user_id, at in pending.items():
+        row = rows.get(user_id)
+        if row is not None and (row["last_seen"] is None or row["last_seen"] < at):
+            row["last_seen"] = at
+    results = sorted(rows.values(), key=lambda r: (r["last_seen"] is not None, r["last_seen"] or datetime.min), reverse=True)
+    return [{"name": r["name"], "last_seen": r["last_seen"]} for r in results[:limit]]
 
 def get_last_processed_cmd_id(user_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT last_processed_cmd_id FROM users WHERE id = %s", (user_id,))
-    result = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT last_processed_cmd_id FROM users WHERE id = %s", (user_id,))
+        result = cursor.fetchone()
+        cursor.close()
     return result[0] if result and result[0] else 0
 
-def update_last_processed_cmd(user_id, cmd_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET last_processed_cmd_id = %s WHERE id = %s", (cmd_id, user_id))
-    conn.commit()
-    cursor.close()
-    conn.close()
+def update_last_processed_cmd(user_id, cmd_id, argument_id=0):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE users SET last_processed_cmd_id = %s, last_processed_arg_id = %s WHERE id = %s",
+            (cmd_id, argument_id, user_id)
+        )
+        conn.commit()
+        cursor.close()
 
 # ---------------------- ADMIN ----------------------
 def get_users():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.execute("SELECT id, username, role FROM users")
-        users = cursor.fetchall()
-        return users
-    finally:
-        cursor.close()
-        conn.close()
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT id, username, role FROM users")
+            users = cursor.fetchall()
+            return users
+        finally:
+            cursor.close()
 
 
 def get_all_validators():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM users WHERE role = 'validator'")
-    validators = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT id, name FROM users WHERE role = 'validator'")
+        validators = cursor.fetchall()
+        cursor.close()
     return validators
 
 def get_user_counts_by_role():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM users WHERE role='validator'")
-    validator_count = cursor.fetchone()[0]
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users WHERE role='validator'")
+        validator_count = cursor.fetchone()[0]
 
-    cursor.execute("SELECT COUNT(*) FROM users WHERE role='viewer'")
-    viewer_count = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM users WHERE role='viewer'")
+        viewer_count = cursor.fetchone()[0]
 
-    cursor.execute("SELECT name FROM users WHERE role='validator'")
-    validator_names = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT name FROM users WHERE role='validator'")
+        validator_names = [row[0] for row in cursor.fetchall()]
 
-    cursor.execute("SELECT name FROM users WHERE role='viewer'")
-    viewer_names = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT name FROM users WHERE role='viewer'")
+        viewer_names = [row[0] for row in cursor.fetchall()]
 
-    cursor.close()
-    conn.close()
+        cursor.close()
 
     return validator_count, viewer_count, validator_names, viewer_names
-from datetime import datetime
+
+def _flush_last_seen(last_seen):
+    """Writes {user_id: datetime} to validator_stats.last_seen in one upsert, never moving a value back."""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO validator_stats (user_id, last_seen) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE
+                last_seen = GREATEST(COALESCE(last_seen, VALUES(last_seen)), VALUES(last_seen))
+        """, list(last_seen.items()))
+        conn.commit()
+        cursor.close()
+
+_heartbeats = None
+_heartbeats_lock = threading.Lock()
+
+def get_heartbeats():
+    global _heartbeats
+    if _heartbeats is None:
+        with _heartbeats_lock:
+            if _heartbeats is None:
+                _heartbeats = HeartbeatAggregator(_flush_last_seen, HEARTBEAT_FLUSH_INTERVAL)
+    return _heartbeats
 
 def update_last_seen(user_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET last_seen = %s WHERE id = %s", (datetime.now(), user_id))
-    conn.commit()
-    cursor.close()
-    conn.close()
+    """Marks the user active now; written to validator_stats.last_seen with the next batched flush."""
+    get_heartbeats().beat(user_id)
+
+def get_heartbeat_stats():
+    return get_heartbeats().stats()
 
 
 def get_validator_stats(user_id):
-    conn = get_connection()
-    cursor = conn.cursor()
+    with connection() as conn:
+        cursor = conn.cursor()
 
-    try:
-        # Dynamic count
         try:
-            cursor.execute(f"SELECT COUNT(*) FROM dynamic_cmds_user_{user_id}")
-            dynamic_count = cursor.fetchone()[0]
-        except:
-            dynamic_count = 0
+            # Counters maintained by the write path (primary-key lookup)
+            cursor.execute("SELECT dynamic, static FROM validator_stats WHERE user_id = %s", (user_id,))
+            row = cursor.fetchone()
+            dynamic_count, static_count = row if row else (0, 0)
+
+            processed = dynamic_count + static_count
+
+            # Total available commands
+            cursor.execute("SELECT COUNT(DISTINCT id) FROM commands")
+            total_commands = cursor.fetchone()[0]
+            remaining = total_commands - processed
+
+            return {
+                "dynamic": dynamic_count,
+                "static": static_count,
+                "processed": processed,
+                "remaining": remaining,
+                "total": total_commands
+            }
+
+        except Exception as e:
+            print("Error in get_validator_stats:", e)
+            return {
+                "dynamic": 0,
+                "static": 0,
+                "processed": 0,
+                "remaining": 0,
+                "total": 0
+            }
+        finally:
+            cursor.close()
+
+def get_all_validator_stats(cursor=None):
+    """
+    Stats for every validator from one query over the validator_stats counters:
+    [{'id', 'name', 'last_command_id', 'dynamic', 'static', 'processed', 'remaining', 'total'}, ...]
+    Runs on `cursor` (a dictionary cursor) when given, e.g. inside read_with_stored_events.
+    Errors propagate: an empty list always means there are no validators.
+    """
+    if cursor is None:
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                return get_all_validator_stats(cursor)
+            finally:
+                cursor.close()
 
-        # Static count
-        try:
-            cursor.execute(f"SELECT COUNT(*) FROM static_cmds_user_{user_id}")
-            static_count = cursor.fetchone()[0]
-        except:
-            static_count = 0
-
-        processed = dynamic_count + static_count
-
-        # Total available commands
-        cursor.execute("SELECT COUNT(DISTINCT id) FROM commands")
-        total_commands = cursor.fetchone()[0]
-        remaining = total_commands - processed
-
-        return {
-            "dynamic": dynamic_count,
-            "static": static_count,
-            "processed": processed,
-            "remaining": remaining,
-            "total": total_commands
-        }
-
-    except Exception as e:
-        print("Error in get_validator_stats:", e)
-        return {
-            "dynamic": 0,
-            "static": 0,
-            "processed": 0,
-            "remaining": 0,
-            "total": 0
-        }
-    finally:
-        cursor.close()
-        conn.close()
+    cursor.execute("""
+        SELECT
+            u.id, u.name, vs.last_command_id,
+            COALESCE(vs.dynamic, 0) AS dynamic,
+            COALESCE(vs.static, 0) AS static,
+            (SELECT COUNT(*) FROM commands) AS total
+        FROM users u
+        LEFT JOIN validator_stats vs ON vs.user_id = u.id
+        WHERE u.role = 'validator'
+    """)
+    rows = cursor.fetchall()
+
+    for row in rows:
+        row["dynamic"] = int(row["dynamic"])
+        row["static"] = int(row["static"])
+        row["processed"] = row["dynamic"] + row["static"]
+        row["remaining"] = row["total"] - row["processed"]
+    return rows
+
+def get_leaderboard_counts(today_start, week_start, cursor=None):
+    """
+    One aggregate query for the leaderboard cold start:
+    [{'id', 'name', 'total', 'today', 'week'}, ...] for every validator. All-time totals come
+    from validator_stats; the windows scan only classifications since `week_start`.
+    Runs on `cursor` (a dictionary cursor) when given; errors propagate.
+    """
+    if cursor is None:
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                return get_leaderboard_counts(today_start, week_start, cursor)
+            finally:
+                cursor.close()
+
+    cursor.execute("""
+        SELECT
+            u.id, u.name,
+            COALESCE(vs.dynamic + vs.static, 0) AS total,
+            COALESCE(w.today, 0) AS today,
+            COALESCE(w.week, 0) AS week
+        FROM users u
+        LEFT JOIN validator_stats vs ON vs.user_id = u.id
+        LEFT JOIN (
+            SELECT user_id, SUM(processed_time >= %s) AS today, COUNT(*) AS week
+            FROM classifications
+            WHERE processed_time >= %s
+            GROUP BY user_id
+        ) w ON w.user_id = u.id
+        WHERE u.role = 'validator'
+    """, (today_start, week_start))
+    rows = cursor.fetchall()
+
+    for row in rows:
+        for key in ("total", "today", "week"):
+            row[key] = int(row[key])
+    return rows
+
+def reconcile_validator_stats(user_ids=None):
+    """
+    Recomputes validator_stats from the classifications rows, one user per transaction
+    (every row in users when `user_ids` is None, including users with no classifications).
+    Returns the number of users done.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        if user_ids is None:
+            cursor.execute("SELECT id FROM users")
+            user_ids = [row[0] for row in cursor.fetchall()]
+
+        for user_id in user_ids:
+            cursor.execute("""
+                INSERT INTO validator_stats (user_id, dynamic, static, last_command_id, last_seen)
+                SELECT
+                    u.id,
+                    COALESCE(SUM(cl.action = 'Dynamic'), 0),
+                    COALESCE(SUM(cl.action = 'Static'), 0),
+                    u.last_processed_cmd_id,
+                    -- newest of the legacy users.last_seen and the last click (either may be NULL)
+                    GREATEST(COALESCE(u.last_seen, MAX(cl.processed_time)), COALESCE(MAX(cl.processed_time), u.last_seen))
+                FROM users u
+                LEFT JOIN classifications cl ON cl.user_id = u.id
+                WHERE u.id = %s
+                GROUP BY u.id, u.last_processed_cmd_id, u.last_seen
+                ON DUPLICATE KEY UPDATE
+                    dynamic = VALUES(dynamic),
+                    static = VALUES(static),
+                    last_command_id = VALUES(last_command_id),
+                    -- heartbeats keep it current; never move it back
+                    last_seen = GREATEST(COALESCE(last_seen, VALUES(last_seen)), COALESCE(VALUES(last_seen), last_seen))
+            """, (user_id,))
+            conn.commit()
+        cursor.close()
+    return len(user_ids)
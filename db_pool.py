@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within the wait timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB connections shared by every Streamlit session in the process.
+
+    - At most `size` connections are open at once; callers wait up to `timeout` seconds for one.
+    - Connections older than `max_lifetime` seconds are closed and replaced.
+    - Connections idle for more than `ping_interval` seconds are pinged before reuse.
+    - Every connection is rolled back when returned, so no transaction/snapshot leaks
+      from one caller to the next.
+    """
+
+    def __init__(self, factory, size=10, timeout=10.0, max_lifetime=1800, ping_interval=30):
+        self._factory = factory
+        self._size = size
+        self._timeout = timeout
+        self._max_lifetime = max_lifetime
+        self._ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (conn, created_at, last_used)
+        self._born = {}        # id(conn) -> created_at, for connections handed out
+        self._open = 0
+        self._waiters = deque()  # FIFO of tokens for callers blocked in acquire()
+
+        self._stats = {
+            "acquired": 0,
+            "hits": 0,          # served from an idle connection
+            "created": 0,       # new connection opened
+            "waits": 0,         # had to wait for a connection to come back
+            "wait_time": 0.0,   # total seconds spent waiting
+            "timeouts": 0,
+            "recycled": 0,      # closed because max_lifetime was reached
+            "ping_failures": 0, # closed because the health check failed
+            "discarded": 0,     # closed because the caller hit a broken connection
+        }
+
+    # ---------------------- acquire / release ------------------------
+
+    def acquire(self):
+        waited_from = None
+
+        while True:
+            candidate = None
+            create = False
+            token = object()
+            queued = False
+            with self._cond:
+                while True:
+                    # FIFO hand-off: once someone is waiting, newcomers queue behind them
+                    if not self._waiters or self._waiters[0] is token:
+                        if self._idle:
+                            candidate = self._idle.pop()
+                            break
+                        if self._open < self._size:
+                            self._open += 1
+                            create = True
+                            break
+                    now = time.monotonic()
+                    if waited_from is None:
+                        waited_from = now
+                        self._stats["waits"] += 1
+                    if not queued:
+                        self._waiters.append(token)
+                        queued = True
+                    remaining = waited_from + self._timeout - now
+                    if remaining <= 0:
+                        self._waiters.remove(token)
+                        self._stats["timeouts"] += 1
+                        self._stats["wait_time"] += now - waited_from
+                        self._cond.notify_all()
+                        raise PoolTimeout(f"No DB connection available after {self._timeout}s")
+                    self._cond.wait(remaining)
+                if queued:
+                    self._waiters.popleft()
+                    self._cond.notify_all()
+
+            if create:
+                try:
+                    conn = self._factory()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify_all()
+                    raise
+                return self._hand_out(conn, time.monotonic(), waited_from, hit=False)
+
+            conn, created_at, last_used = candidate
+            now = time.monotonic()
+            if now - created_at > self._max_lifetime:
+                self._close(conn, "recycled")
+                continue
+            if now - last_used > self._ping_interval and not self._healthy(conn):
+                self._close(conn, "ping_failures")
+                continue
+            return self._hand_out(conn, created_at, waited_from, hit=True)
+
+    def release(self, conn, broken=False):
+        with self._cond:
+            created_at = self._born.pop(id(conn), None)
+        if created_at is None:
+            return
+        if not broken:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            self._close(conn, "discarded")
+            return
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify_all()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = not self._healthy(conn)
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    # ---------------------- helpers ------------------------
+
+    def _hand_out(self, conn, created_at, waited_from, hit):
+        with self._cond:
+            self._born[id(conn)] = created_at
+            self._stats["acquired"] += 1
+            self._stats["hits" if hit else "created"] += 1
+            if waited_from is not None:
+                self._stats["wait_time"] += time.monotonic() - waited_from
+        return conn
+
+    def _healthy(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _close(self, conn, reason):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._stats[reason] += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["open"] = self._open
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._open - len(self._idle)
+        acquired = stats["acquired"] or 1
+        stats["hit_rate"] = stats["hits"] / acquired
+        stats["avg_wait_ms"] = 1000 * stats["wait_time"] / max(stats["waits"], 1)
+        return stats
+
+    def close_all(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _, _ in idle:
+            self._close(conn, "discarded")
@@ -0,0 +1,244 @@
+# db_tools.py
+# Maintenance jobs for the rule_validation database.
+#
+#   python db_tools.py migrate-classifications [--batch-size 5000] [--drop-old]
+#   python db_tools.py convert-progress
+#   python db_tools.py reconcile-stats [--user-id N ...]
+#   python db_tools.py normalize-contexts [--batch-size 5000]
+#   python db_tools.py bump-corpus-version
+
+import argparse
+import re
+import time
+
+from db import (
+    bump_corpus_version, connection, init_schema, reconcile_validator_stats, CONTEXT_RAW, CONTEXT_NORMALIZED,
+)
+
+# -------------------- Per-user tables -> classifications --------------------
+
+_LEGACY_TABLE = re.compile(r"^(dynamic|static)_cmds_user_(\d+)$")
+
+def _legacy_tables(cursor):
+    cursor.execute("""
+        SELECT table_name FROM information_schema.tables
+        WHERE table_schema = DATABASE()
+          AND (table_name LIKE 'dynamic\\_cmds\\_user\\_%' OR table_name LIKE 'static\\_cmds\\_user\\_%')
+        ORDER BY table_name
+    """)
+    tables = []
+    for (name,) in cursor.fetchall():
+        m = _LEGACY_TABLE.match(name)
+        if m:
+            tables.append((name, m.group(1).capitalize(), int(m.group(2))))
+    return tables
+
+def migrate_classifications(batch_size=5000, drop_old=False):
+    """
+    Streams every dynamic_cmds_user_N / static_cmds_user_N table into `classifications`
+    in id order, `batch_size` rows per transaction. The last copied id of each source table
+    is committed with its batch, so an interrupted run resumes where it stopped.
+    """
+    init_schema()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS classifications_migration (
+                source_table VARCHAR(64) PRIMARY KEY,
+                last_id INT NOT NULL
+            )
+        """)
+        conn.commit()
+
+        total = 0
+        started = time.time()
+        for table, action, user_id in _legacy_tables(cursor):
+            cursor.execute("SELECT last_id FROM classifications_migration WHERE source_table = %s", (table,))
+            row = cursor.fetchone()
+            last_id = row[0] if row else 0
+            copied = 0
+
+            while True:
+                # argument_id was never stored; recover it from the command line text
+                cursor.execute(f"""
+                    SELECT t.id, t.command_id,
+                           (SELECT MIN(a.id) FROM arguments a
+                            WHERE a.command_id = t.command_id AND a.full_command_line = t.command_text),
+                           t.command_text, t.processed_time
+                    FROM {table} t
+                    WHERE t.id > %s
+                    ORDER BY t.id
+                    LIMIT %s
+                """, (last_id, batch_size))
+                batch = cursor.fetchall()
+                if not batch:
+                    break
+
+                cursor.executemany("""
+                    INSERT INTO classifications
+                        (user_id, command_id, argument_id, action, command_text, processed_time)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, [(user_id, cmd_id, arg_id, action, text, ts) for _, cmd_id, arg_id, text, ts in batch])
+                last_id = batch[-1][0]
+                cursor.execute("""
+                    INSERT INTO classifications_migration (source_table, last_id) VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE last_id = VALUES(last_id)
+                """, (table, last_id))
+                conn.commit()
+                copied += len(batch)
+
+            total += copied
+            print(f"{table}: {copied} rows copied (user {user_id}, {action})")
+            if drop_old:
+                cursor.execute(f"DROP TABLE {table}")
+                cursor.execute("DELETE FROM classifications_migration WHERE source_table = %s", (table,))
+                conn.commit()
+
+        cursor.close()
+
+    elapsed = max(time.time() - started, 1e-6)
+    print(f"Done: {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)")
+    # rows were bulk-copied around the write path, so rebuild the counters
+    reconcile_stats()
+    return total
+
+# -------------------- Progress cursor --------------------
+
+def convert_progress():
+    """
+    Rewrites legacy progress cursors (users.last_processed_cmd_id holding a list position,
+    marked by last_processed_arg_id IS NULL) as the command/argument of the user's most
+    recent classification. Run after migrate-classifications.
+    """
+    init_schema()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users WHERE last_processed_arg_id IS NULL")
+        user_ids = [row[0] for row in cursor.fetchall()]
+
+        for user_id in user_ids:
+            cursor.execute("""
+                SELECT command_id, argument_id FROM classifications
+                WHERE user_id = %s
+                ORDER BY processed_time DESC, id DESC
+                LIMIT 1
+            """, (user_id,))
+            row = cursor.fetchone()
+            cmd_id, arg_id = (row[0], row[1] or 0) if row else (0, 0)
+            cursor.execute(
+                "UPDATE users SET last_processed_cmd_id = %s, last_processed_arg_id = %s WHERE id = %s",
+                (cmd_id, arg_id, user_id)
+            )
+        conn.commit()
+        cursor.close()
+
+    print(f"Converted progress cursor for {len(user_ids)} users")
+    return len(user_ids)
+
+# -------------------- Validator counters --------------------
+
+def reconcile_stats(user_ids=None):
+    """Rebuilds validator_stats from the classifications rows."""
+    init_schema()
+    started = time.time()
+    done = reconcile_validator_stats(user_ids)
+    print(f"Reconciled validator_stats for {done} users in {time.time() - started:.1f}s")
+    return done
+
+# -------------------- Context text --------------------
+
+def normalize_contexts(batch_size=5000):
+    """
+    Stores every raw context blob in display form once (same unescaping as
+    db.normalize_context, done by MySQL in place) and flags it CONTEXT_NORMALIZED, walking
+    the raw rows' argument_ids `batch_size` at a time (through idx_contexts_argument) so
+    each transaction stays small however sparse the ids are. Safe to re-run.
+    """
+    init_schema()
+    with connection() as conn:
+        cursor = conn.cursor()
+        total = 0
+        started = time.time()
+        last = -1
+        while True:
+            # upper end of the next batch_size raw rows after the last range
+            cursor.execute("""
+                SELECT MAX(argument_id) FROM (
+                    SELECT argument_id FROM contexts
+                    WHERE context_format = %s AND argument_id > %s
+                    ORDER BY argument_id
+                    LIMIT %s
+                ) AS batch
+            """, (CONTEXT_RAW, last, batch_size))
+            high = cursor.fetchone()[0]
+            if high is None:
+                break
+            cursor.execute("""
+                UPDATE contexts
+                SET context_lines = REPLACE(REPLACE(context_lines, %s, %s), %s, %s),
+                    context_format = %s
+                WHERE context_format = %s AND argument_id > %s AND argument_id <= %s
+            """, ("\\n", "\n", "\\\\", "\\", CONTEXT_NORMALIZED, CONTEXT_RAW, last, high))
+            changed = cursor.rowcount
+            if changed:
+                bump_corpus_version(cursor)
+            conn.commit()
+            total += changed
+            last = high
+        cursor.close()
+
+    elapsed = max(time.time() - started, 1e-6)
+    print(f"Normalized {total} context rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)")
+    return total
+
+def bump_corpus():
+    """For corpus edits made outside importer.py / db_tools.py: makes app caches reload."""
+    init_schema()
+    with connection() as conn:
+        cursor = conn.cursor()
+        bump_corpus_version(cursor)
+        conn.commit()
+        cursor.close()
+    print("Corpus version bumped; caches reload within CORPUS_CACHE_TTL")
+
+# -------------------- CLI --------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="rule_validation maintenance jobs")
+    sub = parser.add_subparsers(dest="job", required=True)
+
+    mig = sub.add_parser("migrate-classifications",
+                         help="copy per-user dynamic/static tables into the classifications table")
+    mig.add_argument("--batch-size", type=int, default=5000)
+    mig.add_argument("--drop-old", action="store_true",
+                     help="drop each per-user table once it has been copied")
+
+    sub.add_parser("convert-progress",
+                   help="turn legacy position-based progress into command-id cursors")
+
+    rec = sub.add_parser("reconcile-stats",
+                         help="recompute validator_stats counters from raw classifications")
+    rec.add_argument("--user-id", type=int, action="append", dest="user_ids",
+                     help="only these users (repeatable); default all")
+
+    norm = sub.add_parser("normalize-contexts",
+                          help="store context text unescaped once so reads are pass-through")
+    norm.add_argument("--batch-size", type=int, default=5000)
+
+    sub.add_parser("bump-corpus-version",
+                   help="mark the corpus changed after editing commands/arguments/contexts by hand")
+
+    args = parser.parse_args(argv)
+    if args.job == "migrate-classifications":
+        migrate_classifications(batch_size=args.batch_size, drop_old=args.drop_old)
+    elif args.job == "convert-progress":
+        convert_progress()
+    elif args.job == "reconcile-stats":
+        reconcile_stats(args.user_ids)
+    elif args.job == "normalize-contexts":
+        normalize_contexts(batch_size=args.batch_size)
+    elif args.job == "bump-corpus-version":
+        bump_corpus()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# decision_log.py
+# Append-only store of rule decisions (Approved / Partially Correct / Rejected).
+#
+# Replaces rewriting data/history.json + approved.json / partially_correct.json / rejected.json
+# on every click: a decision is one INSERT into a SQLite file (WAL mode, so appends from several
+# sessions or processes are atomic and never lose each other), and the approved / partial /
+# rejected lists are derived from each rule's latest decision when asked for.
+#
+#   python decision_log.py import data/            # one-off: load the existing JSON files
+#   python decision_log.py export data/            # write the derived JSON views back out
+#   python decision_log.py show rule-1
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from config import DECISION_LOG_PATH
+
+APPROVED = "Approved"
+PARTIAL = "Partially Correct"
+REJECTED = "Rejected"
+ACTIONS = (APPROVED, PARTIAL, REJECTED)
+
+_VIEW_FILES = {APPROVED: "approved.json", PARTIAL: "partially_correct.json", REJECTED: "rejected.json"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS decisions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    rule_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    user TEXT,
+    timestamp TEXT NOT NULL,
+    comment TEXT,
+    rule TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_decisions_event ON decisions (rule_id, user, timestamp, action);
+"""
+
+
+class DecisionLog:
+    """
+    SQLite-backed decision log with an in-memory index by rule_id and by user.
+
+    The index is caught up from the file (rows with seq above the last one seen) before
+    every read, so decisions appended by other processes show up without a full reload.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._last_seq = 0
+        self._by_rule = {}   # rule_id -> [decision, ...] in append order
+        self._by_user = {}   # user -> [decision, ...]
+
+    def _catch_up(self):
+        rows = self._conn.execute(
+            "SELECT seq, rule_id, action, user, timestamp, comment, rule FROM decisions WHERE seq > ? ORDER BY seq",
+            (self._last_seq,)
+        ).fetchall()
+        for seq, rule_id, action, user, timestamp, comment, rule in rows:
+            decision = {
+                "seq": seq, "rule_id": rule_id, "action": action, "user": user,
+                "timestamp": timestamp, "comment": comment,
+                "rule": json.loads(rule) if rule else None,
+            }
+            self._by_rule.setdefault(rule_id, []).append(decision)
+            self._by_user.setdefault(user, []).append(decision)
+            self._last_seq = seq
+
+    # ---------------------- writes ------------------------
+
+    def append(self, rule_id, action, user, rule=None, comment=None, timestamp=None):
+        """Records one decision; returns False when the identical event was already logged."""
+        if action not in ACTIONS:
+            raise ValueError(f"unknown action {action!r}")
+        timestamp = timestamp or datetime.now().isoformat(sep=" ", timespec="microseconds")
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO decisions (rule_id, action, user, timestamp, comment, rule) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (rule_id, action, user, timestamp, comment, json.dumps(rule) if rule else None)
+            )
+            self._catch_up()
+            return cursor.rowcount == 1
+
+    # ---------------------- reads ------------------------
+
+    def for_rule(self, rule_id):
+        with self._lock:
+            self._catch_up()
+            return list(self._by_rule.get(rule_id, ()))
+
+    def for_user(self, user):
+        with self._lock:
+            self._catch_up()
+            return list(self._by_user.get(user, ()))
+
+    def latest(self, rule_id):
+        decisions = self.for_rule(rule_id)
+        return decisions[-1] if decisions else None
+
+    def history(self):
+        """Every decision in append order, in the shape of data/history.json."""
+        with self._lock:
+            self._catch_up()
+            decisions = sorted((d for ds in self._by_rule.values() for d in ds), key=lambda d: d["seq"])
+        return [
+            {"rule_id": d["rule_id"], "action": d["action"], "user": d["user"], "timestamp": d["timestamp"]}
+            for d in decisions
+        ]
+
+    def view(self, action):
+        """Rules whose latest decision is `action`, as rule dicts (plus comment), in decision order."""
+        with self._lock:
+            self._catch_up()
+            latest = [ds[-1] for ds in self._by_rule.values()]
+        rules = []
+        for d in sorted(latest, key=lambda d: d["seq"]):
+            if d["action"] != action:
+                continue
+            rule = dict(d["rule"] or {"id": d["rule_id"]})
+            if d["comment"]:
+                rule["comment"] = d["comment"]
+            rules.append(rule)
+        return rules
+
+    def approved(self):
+        return self.view(APPROVED)
+
+    def partially_correct(self):
+        return self.view(PARTIAL)
+
+    def rejected(self):
+        return self.view(REJECTED)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_log = None
+_log_lock = threading.Lock()
+
+def get_decision_log():
+    """Process-wide DecisionLog on DECISION_LOG_PATH."""
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = DecisionLog(DECISION_LOG_PATH)
+        return _log
+
+# -------------------- JSON files --------------------
+
+def _read_json_list(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return []
+    return json.loads(text) if text.strip() else []
+
+def import_json(log, data_dir):
+    """
+    Loads history.json into the log, attaching the rule bodies (and comments) found in
+    approved.json / partially_correct.json / rejected.json. Safe to run twice.
+    """
+    bodies = {}
+    for action, name in _VIEW_FILES.items():
+        for rule in _read_json_list(os.path.join(data_dir, name)):
+            bodies[(rule.get("id"), action)] = rule
+
+    added = 0
+    for entry in _read_json_list(os.path.join(data_dir, "history.json")):
+        rule = dict(bodies.get((entry["rule_id"], entry["action"])) or {}) or None
+        comment = rule.pop("comment", None) if rule else None
+        added += log.append(entry["rule_id"], entry["action"], entry.get("user"),
+                            rule=rule, comment=comment, timestamp=entry["timestamp"])
+    return added
+
+def export_json(log, data_dir):
+    """Writes history.json and the three derived view files from the log."""
+    outputs = {"history.json": log.history()}
+    for action, name in _VIEW_FILES.items():
+        outputs[name] = log.view(action)
+    for name, rows in outputs.items():
+        path = os.path.join(data_dir, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=4)
+        os.replace(path + ".tmp", path)
+
+# -------------------- CLI --------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rule decision log")
+    parser.add_argument("--db", default=DECISION_LOG_PATH, help="SQLite file of the log")
+    sub = parser.add_subparsers(dest="job", required=True)
+    imp = sub.add_parser("import", help="load history.json and the approved/partial/rejected files")
+    imp.add_argument("data_dir")
+    exp = sub.add_parser("export", help="write history.json and the derived view files")
+    exp.add_argument("data_dir")
+    show = sub.add_parser("show", help="print the decisions of one rule")
+    show.add_argument("rule_id")
+    args = parser.parse_args(argv)
+
+    log = DecisionLog(args.db)
+    if args.job == "import":
+        print(f"Imported {import_json(log, args.data_dir)} decisions")
+    elif args.job == "export":
+        export_json(log, args.data_dir)
+        print(f"Exported {len(log.history())} decisions")
+    elif args.job == "show":
+        for d in log.for_rule(args.rule_id):
+            print(d["timestamp"], d["action"], d["user"], d["comment"] or "")
+    log.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import threading
+
+# Topics
+CLASSIFIED = "classified"   # event_id, user_id, command_id, argument_id, action, at (datetime)
+
+
+class EventBus:
+    """
+    In-process publish/subscribe. Handlers run synchronously in the publishing thread,
+    so they must only update in-memory state; a failing handler is logged and skipped.
+    Every Streamlit session in the process shares one bus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers = {}
+
+    def subscribe(self, topic, handler):
+        with self._lock:
+            handlers = self._handlers.setdefault(topic, [])
+            if handler not in handlers:
+                handlers.append(handler)
+
+    def unsubscribe(self, topic, handler):
+        with self._lock:
+            if handler in self._handlers.get(topic, ()):
+                self._handlers[topic].remove(handler)
+
+    def publish(self, topic, **payload):
+        with self._lock:
+            handlers = list(self._handlers.get(topic, ()))
+        for handler in handlers:
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"Error in {topic} event handler:", e)
+
+
+_bus = EventBus()
+
+def subscribe(topic, handler):
+    _bus.subscribe(topic, handler)
+
+def unsubscribe(topic, handler):
+    _bus.unsubscribe(topic, handler)
+
+def publish(topic, **payload):
+    _bus.publish(topic, **payload)
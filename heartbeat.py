@@ -0,0 +1,78 @@
+import threading
+import time
+from datetime import datetime
+
+
+class HeartbeatAggregator:
+    """
+    Coalesces "user was active at T" updates in memory and hands them to `flush` as one
+    {user_id: last_seen} dict every `interval` seconds, from a background thread started
+    on the first beat. Only the latest time per user is kept, so N clicks cost one write.
+
+    pending() returns the beats not yet committed (including a batch being flushed), for
+    readers that want to merge them over what the database holds.
+    """
+
+    def __init__(self, flush, interval=15.0):
+        self._flush = flush
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._inflight = {}
+        self._thread = None
+        self._stats = {"beats": 0, "flushes": 0, "rows": 0, "errors": 0, "last_error": None}
+
+    def beat(self, user_id, at=None):
+        at = at or datetime.now()
+        with self._lock:
+            if self._pending.get(user_id) is None or self._pending[user_id] < at:
+                self._pending[user_id] = at
+            self._stats["beats"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="heartbeats", daemon=True)
+                self._thread.start()
+
+    def pending(self):
+        with self._lock:
+            merged = dict(self._inflight)
+            for user_id, at in self._pending.items():
+                if merged.get(user_id) is None or merged[user_id] < at:
+                    merged[user_id] = at
+        return merged
+
+    def flush_now(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+        if not batch:
+            return 0
+        try:
+            self._flush(batch)
+        except Exception as e:
+            print("Error flushing last_seen heartbeats:", e)
+            with self._lock:
+                # keep them for the next round unless a newer beat already replaced them
+                for user_id, at in batch.items():
+                    if self._pending.get(user_id) is None or self._pending[user_id] < at:
+                        self._pending[user_id] = at
+                self._inflight = {}
+                self._stats["errors"] += 1
+                self._stats["last_error"] = str(e)
+            return 0
+        with self._lock:
+            self._inflight = {}
+            self._stats["flushes"] += 1
+            self._stats["rows"] += len(batch)
+        return len(batch)
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            self.flush_now()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats["interval_s"] = self._interval
+        return stats
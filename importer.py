@@ -0,0 +1,217 @@
+# importer.py
+# Loads rule files from data/ into the commands / arguments / contexts tables.
+#
+#   python importer.py data/input.json [more files ...] [--chunk-size 5000]
+#
+# Files are streamed (a top-level JSON array or JSON Lines), never read whole. Each rule
+# becomes one argument row (its `original` line) under the command named by `command`;
+# `locations`, when present, is stored as the argument's context. Duplicates are skipped
+# by rule id and by normalized text, within a run and against rows imported earlier.
+
+import argparse
+import hashlib
+import json
+import time
+
+from config import IMPORT_CHUNK_SIZE
+from db import bump_corpus_version, connection, init_schema, CONTEXT_NORMALIZED
+
+_READ_SIZE = 1 << 16
+
+# -------------------- Streaming readers --------------------
+
+def _iter_json_array(f):
+    """Yields the elements of a top-level JSON array one at a time from a text file."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        # skip whitespace and separators, pulling more text when the buffer runs dry
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            chunk = f.read(_READ_SIZE)
+            buf, pos = buf[pos:] + chunk, 0
+            eof = not chunk
+        if pos >= len(buf):
+            return
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("expected a JSON array")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+            # a bare number ending exactly at the buffer edge may continue in the next read
+            complete = end < len(buf) or eof
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            # element straddles the buffer boundary
+            chunk = f.read(_READ_SIZE)
+            buf, pos = buf[pos:] + chunk, 0
+            eof = not chunk
+            continue
+        yield item
+        pos = end
+
+def iter_rules(path):
+    """Rules from a .json array or a .jsonl file; empty files yield nothing."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
+
+# -------------------- Dedup keys --------------------
+
+def _normalize(text):
+    return " ".join((text or "").split())
+
+def _key(*parts):
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+def command_key(command):
+    return _key(_normalize(command).lower())
+
+def line_key(command, rule):
+    # rules that normalize to the same line are one argument, whatever their literal values
+    return _key(command_key(command), _normalize(rule.get("normalized") or rule.get("original")))
+
+# -------------------- Loading --------------------
+
+def _placeholders(n):
+    return ", ".join(["%s"] * n)
+
+def _load_chunk(conn, cursor, rules, command_ids):
+    """Inserts one chunk of already-deduplicated rules; returns rows written per table."""
+    written = {"commands": 0, "arguments": 0, "contexts": 0}
+
+    # commands: INSERT IGNORE on the unique key, then read back the ids we don't know yet
+    new_cmds = {}
+    for rule in rules:
+        ckey = rule["_command_key"]
+        if ckey not in command_ids:
+            new_cmds.setdefault(ckey, _normalize(rule.get("command")))
+    if new_cmds:
+        cursor.executemany(
+            "INSERT IGNORE INTO commands (command_key, command_text) VALUES (%s, %s)",
+            list(new_cmds.items())
+        )
+        written["commands"] = cursor.rowcount
+        keys = list(new_cmds)
+        cursor.execute(
+            f"SELECT command_key, id FROM commands WHERE command_key IN ({_placeholders(len(keys))})", keys
+        )
+        command_ids.update(cursor.fetchall())
+
+    # arguments: skip lines imported by an earlier run
+    keys = [rule["_line_key"] for rule in rules]
+    cursor.execute(f"SELECT line_key FROM arguments WHERE line_key IN ({_placeholders(len(keys))})", keys)
+    existing = {row[0] for row in cursor.fetchall()}
+    fresh = [rule for rule in rules if rule["_line_key"] not in existing]
+    if fresh:
+        cursor.executemany(
+            "INSERT INTO arguments (command_id, full_command_line, line_key) VALUES (%s, %s, %s)",
+            [(command_ids[r["_command_key"]], r.get("original") or "", r["_line_key"]) for r in fresh]
+        )
+        written["arguments"] = cursor.rowcount
+
+        keys = [rule["_line_key"] for rule in fresh]
+        cursor.execute(f"SELECT line_key, id FROM arguments WHERE line_key IN ({_placeholders(len(keys))})", keys)
+        arg_ids = dict(cursor.fetchall())
+        contexts = [
+            (arg_ids[r["_line_key"]], "\n".join(r["locations"]), CONTEXT_NORMALIZED)
+            for r in fresh if r.get("locations")
+        ]
+        if contexts:
+            cursor.executemany(
+                "INSERT INTO contexts (argument_id, context_lines, context_format) VALUES (%s, %s, %s)",
+                contexts
+            )
+            written["contexts"] = cursor.rowcount
+
+    if any(written.values()):
+        bump_corpus_version(cursor)
+    conn.commit()
+    return written
+
+def import_files(paths, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Streams every file in `paths` and loads it `chunk_size` rules per transaction with
+    multi-row executemany inserts. Re-running on the same files inserts nothing.
+    """
+    init_schema()
+    seen_rules = set()
+    seen_lines = set()
+    command_ids = {}
+    totals = {"rules": 0, "duplicates": 0, "commands": 0, "arguments": 0, "contexts": 0}
+    started = time.time()
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        def flush(chunk):
+            for table, n in _load_chunk(conn, cursor, chunk, command_ids).items():
+                totals[table] += n
+            chunk.clear()
+            elapsed = max(time.time() - started, 1e-6)
+            print(f"  {totals['rules']} rules, {totals['arguments']} arguments "
+                  f"({totals['rules'] / elapsed:.0f} rules/s)")
+
+        for path in paths:
+            chunk = []
+            for rule in iter_rules(path):
+                totals["rules"] += 1
+                rule_id = rule.get("id")
+                if rule_id is not None:
+                    if rule_id in seen_rules:
+                        totals["duplicates"] += 1
+                        continue
+                    seen_rules.add(rule_id)
+                lkey = line_key(rule.get("command"), rule)
+                if lkey in seen_lines:
+                    totals["duplicates"] += 1
+                    continue
+                seen_lines.add(lkey)
+                rule["_command_key"] = command_key(rule.get("command"))
+                rule["_line_key"] = lkey
+                chunk.append(rule)
+                if len(chunk) >= chunk_size:
+                    flush(chunk)
+            if chunk:
+                flush(chunk)
+            print(f"{path}: done")
+
+        cursor.close()
+
+    elapsed = max(time.time() - started, 1e-6)
+    print(f"Done: {totals['rules']} rules ({totals['duplicates']} duplicates), "
+          f"{totals['commands']} commands, {totals['arguments']} arguments, {totals['contexts']} contexts "
+          f"in {elapsed:.1f}s ({totals['rules'] / elapsed:.0f} rules/s)")
+    return totals
+
+# -------------------- CLI --------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import rule files into commands/arguments/contexts")
+    parser.add_argument("paths", nargs="+", help=".json (array) or .jsonl rule files")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE,
+                        help="rules per executemany batch / transaction")
+    args = parser.parse_args(argv)
+    import_files(args.paths, chunk_size=args.chunk_size)
+
+if __name__ == "__main__":
+    main()
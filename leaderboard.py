@@ -0,0 +1,150 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from cold_start import ColdStart
+from config import LEADERBOARD_SIZE
+from db import get_leaderboard_counts
+from events import CLASSIFIED, subscribe
+
+WINDOWS = ("all", "today", "week")
+
+
+class RankedCounter:
+    """
+    Counts per user kept in a sorted list of (-count, user_id), so an increment is one
+    bisect removal + insertion and top(k) is a slice of the first k entries.
+    """
+
+    def __init__(self, counts=None):
+        self._counts = dict(counts or {})
+        self._order = sorted((-n, user_id) for user_id, n in self._counts.items())
+
+    def add(self, user_id, by=1):
+        old = self._counts.get(user_id)
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old, user_id))]
+        new = (old or 0) + by
+        self._counts[user_id] = new
+        insort(self._order, (-new, user_id))
+
+    def top(self, k):
+        return [(user_id, -neg) for neg, user_id in self._order[:k]]
+
+    def rank(self, user_id):
+        """1-based position, or None for users never counted."""
+        count = self._counts.get(user_id)
+        if count is None:
+            return None
+        return bisect_left(self._order, (-count, user_id)) + 1
+
+    def __len__(self):
+        return len(self._order)
+
+
+def _window_starts(now):
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return today, today - timedelta(days=today.weekday())
+
+
+class Leaderboard:
+    """
+    All-time, today and this-week rankings advanced by CLASSIFIED events. Loaded from one
+    aggregate query (run on a cursor) on first use or after reload(), through
+    cold_start.ColdStart so clicks arriving meanwhile count once; a window is reset to zero
+    when an event or a read falls past its end, so a new day or week starts empty.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._names = {}
+        self._counters = None
+        self._starts = None
+        self._cold_start = ColdStart(self._lock)
+
+    def _ensure_loaded(self):
+        today, week = _window_starts(datetime.now())
+
+        def apply(rows, replay):
+            self._names = {row["id"]: row["name"] for row in rows}
+            self._counters = {
+                window: RankedCounter({row["id"]: row[window if window != "all" else "total"] for row in rows})
+                for window in WINDOWS
+            }
+            self._starts = (today, week)
+            for event in replay:
+                self._add(event)
+
+        self._cold_start.run(
+            lambda: self._counters is None,
+            lambda cursor: self._loader(today, week, cursor),
+            apply,
+        )
+
+    def _roll(self, now):
+        today, week = _window_starts(now)
+        if today > self._starts[0]:
+            self._counters["today"] = RankedCounter({user_id: 0 for user_id in self._names})
+        if week > self._starts[1]:
+            self._counters["week"] = RankedCounter({user_id: 0 for user_id in self._names})
+        self._starts = (max(today, self._starts[0]), max(week, self._starts[1]))
+
+    def _add(self, event):
+        """Counts one event (caller holds the lock and the counters are loaded)."""
+        at = event.get("at") or datetime.now()
+        self._roll(at)
+        user_id = event["user_id"]
+        self._names.setdefault(user_id, f"user {user_id}")
+        self._counters["all"].add(user_id)
+        # a replayed click can predate the current day or week
+        if at >= self._starts[0]:
+            self._counters["today"].add(user_id)
+        if at >= self._starts[1]:
+            self._counters["week"].add(user_id)
+
+    def on_classified(self, event):
+        with self._lock:
+            if self._cold_start.offer(event) and self._counters is not None:
+                self._add(event)
+            # nothing loaded: the next load finds this click in MySQL or in the write queue
+
+    def _locked_counters(self):
+        """Acquires the lock with the counters loaded; reload() may clear them between the two steps."""
+        while True:
+            self._ensure_loaded()
+            self._lock.acquire()
+            if self._counters is not None:
+                return self._counters
+            self._lock.release()
+
+    def top(self, k=LEADERBOARD_SIZE, window="all"):
+        """[(name, count), ...] best first, O(k)."""
+        counters = self._locked_counters()
+        try:
+            self._roll(datetime.now())
+            return [(self._names.get(user_id, f"user {user_id}"), count)
+                    for user_id, count in counters[window].top(k)]
+        finally:
+            self._lock.release()
+
+    def rank(self, user_id, window="all"):
+        counters = self._locked_counters()
+        try:
+            return counters[window].rank(user_id)
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        with self._lock:
+            self._counters = None
+
+
+_leaderboard = Leaderboard(get_leaderboard_counts)
+subscribe(CLASSIFIED, _leaderboard.on_classified)
+
+def get_leaderboard(k=LEADERBOARD_SIZE, window="all"):
+    return _leaderboard.top(k, window)
+
+def reload_leaderboard():
+    _leaderboard.reload()
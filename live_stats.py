@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import deque
+
+from cold_start import ColdStart
+from config import LIVE_THROUGHPUT_WINDOW
+from db import get_all_validator_stats
+from events import CLASSIFIED, subscribe
+
+
+class LiveMonitor:
+    """
+    Per-validator progress kept in memory and advanced by CLASSIFIED events.
+
+    Seeded from `seed` (one aggregate query, run on a cursor) on first read, or again after
+    resync(), through cold_start.ColdStart so clicks arriving meanwhile count once;
+    snapshot() then never touches the database. Throughput is the number of events in the
+    last `window` seconds, scaled to classifications per minute.
+    """
+
+    def __init__(self, seed, window=300):
+        self._seed = seed
+        self._window = window
+        self._lock = threading.Lock()
+        self._validators = {}   # user_id -> {"name", "dynamic", "static", "last_command_id", "recent"}
+        self._total = 0
+        self._seeded = False
+        self._seeded_at = None
+        self._cold_start = ColdStart(self._lock)
+
+    def _entry(self, user_id, name=None):
+        entry = self._validators.get(user_id)
+        if entry is None:
+            entry = {"name": name or f"user {user_id}", "dynamic": 0, "static": 0,
+                     "last_command_id": None, "recent": deque()}
+            self._validators[user_id] = entry
+        return entry
+
+    def _ensure_seeded(self):
+        self._cold_start.run(lambda: not self._seeded, self._seed, self._apply_seed)
+
+    def _apply_seed(self, rows, replay):
+        recent = {user_id: v["recent"] for user_id, v in self._validators.items()}
+        self._validators = {}
+        for row in rows:
+            entry = self._entry(row["id"], row["name"])
+            entry["dynamic"] = row["dynamic"]
+            entry["static"] = row["static"]
+            entry["last_command_id"] = row["last_command_id"]
+            entry["recent"] = recent.get(row["id"], deque())
+            self._total = row["total"]
+        for event in replay:
+            # throughput already has them; only the counters need the replay
+            self._count(self._entry(event["user_id"]), event)
+        self._seeded = True
+        self._seeded_at = time.time()
+
+    @staticmethod
+    def _count(entry, event):
+        entry["dynamic" if event["action"] == "Dynamic" else "static"] += 1
+        entry["last_command_id"] = event["command_id"]
+
+    def on_classified(self, event):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entry(event["user_id"])
+            entry["recent"].append(now)
+            self._trim(entry["recent"], now)
+            if self._cold_start.offer(event):
+                self._count(entry, event)
+
+    def _trim(self, recent, now):
+        while recent and now - recent[0] > self._window:
+            recent.popleft()
+
+    def snapshot(self):
+        """[{'id', 'name', 'dynamic', 'static', 'processed', 'remaining', 'last_command_id', 'per_minute'}, ...]"""
+        self._ensure_seeded()
+        now = time.monotonic()
+        rows = []
+        with self._lock:
+            for user_id, entry in self._validators.items():
+                self._trim(entry["recent"], now)
+                processed = entry["dynamic"] + entry["static"]
+                rows.append({
+                    "id": user_id,
+                    "name": entry["name"],
+                    "dynamic": entry["dynamic"],
+                    "static": entry["static"],
+                    "processed": processed,
+                    "remaining": max(self._total - processed, 0),
+                    "last_command_id": entry["last_command_id"],
+                    "per_minute": len(entry["recent"]) * 60 / self._window,
+                })
+        rows.sort(key=lambda r: (-r["per_minute"], r["name"]))
+        return rows
+
+    def resync(self):
+        """Re-read the counters from the database on the next snapshot (e.g. after new signups)."""
+        with self._lock:
+            self._seeded = False
+
+    def stats(self):
+        with self._lock:
+            return {"validators": len(self._validators), "seeded_at": self._seeded_at,
+                    "window_s": self._window}
+
+
+_monitor = LiveMonitor(get_all_validator_stats, LIVE_THROUGHPUT_WINDOW)
+subscribe(CLASSIFIED, _monitor.on_classified)
+
+def get_live_snapshot():
+    return _monitor.snapshot()
+
+def resync_live_stats():
+    _monitor.resync()
@@ -0,0 +1,130 @@
+# rule_clusters.py
+# Groups near-identical rules so they can be reviewed as one batch.
+#
+#   python rule_clusters.py data/input.json [--threshold 0.5] [--output clusters.json]
+#
+# Two stages, neither compares all pairs, and rules of different commands never cluster:
+#   1. exact: rules of one command whose `normalized` text is the same once digit runs are
+#      masked (maindashInst1 / maindashInst2, `21` / `35`) share one signature;
+#   2. near: one MinHash signature per distinct signature, banded into LSH buckets keyed
+#      by command; members of a bucket are joined (union-find) when their estimated
+#      token-shingle Jaccard similarity reaches the threshold.
+
+import argparse
+import hashlib
+import json
+import re
+import time
+
+from importer import command_key, iter_rules
+
+_DIGITS = re.compile(r"\d+")
+_TOKEN = re.compile(r"<[A-Z_]+>|\w+|[^\w\s]")
+
+_MERSENNE = (1 << 61) - 1
+
+def canonical(rule):
+    """Rule text with instance numbers and values masked."""
+    text = rule.get("normalized") or rule.get("original") or ""
+    return _DIGITS.sub("#", " ".join(text.split()))
+
+def shingles(text, k=3):
+    tokens = _TOKEN.findall(text)
+    if len(tokens) <= k:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+def _h64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+class MinHasher:
+    """`num_perm` universal hash functions (a*x + b mod 2^61-1) with fixed, seed-derived coefficients."""
+
+    def __init__(self, num_perm=64, seed=1):
+        self.params = [
+            (_h64(f"{seed}:a:{i}") % (_MERSENNE - 1) + 1, _h64(f"{seed}:b:{i}") % _MERSENNE)
+            for i in range(num_perm)
+        ]
+
+    def signature(self, items):
+        values = [_h64(item) for item in items]
+        return tuple(min((a * x + b) % _MERSENNE for x in values) for a, b in self.params)
+
+def similarity(sig_a, sig_b):
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            # keep the smaller index as root so cluster representatives are stable
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+def cluster_rules(rules, threshold=0.5, bands=20, rows=3, k=3):
+    """
+    Returns clusters as lists of rule ids, largest first. Cost is linear in the number of
+    rules plus the size of the LSH buckets; rules are never compared pairwise.
+    """
+    # stage 1: exact signatures, per command (same key as importer.py)
+    groups = {}
+    for rule in rules:
+        groups.setdefault((command_key(rule.get("command")), canonical(rule)), []).append(rule.get("id"))
+    keys = list(groups)
+
+    # stage 2: MinHash + LSH over the distinct signatures
+    hasher = MinHasher(num_perm=bands * rows)
+    signatures = [hasher.signature(shingles(text, k)) for _, text in keys]
+    uf = _UnionFind(len(keys))
+    for band in range(bands):
+        buckets = {}
+        lo = band * rows
+        for i, sig in enumerate(signatures):
+            buckets.setdefault((keys[i][0], sig[lo:lo + rows]), []).append(i)
+        for members in buckets.values():
+            first = members[0]
+            for other in members[1:]:
+                # compare with the bucket's first member only: linear per bucket
+                if similarity(signatures[first], signatures[other]) >= threshold:
+                    uf.union(first, other)
+
+    clusters = {}
+    for i, key in enumerate(keys):
+        clusters.setdefault(uf.find(i), []).extend(groups[key])
+    return sorted(clusters.values(), key=lambda ids: (-len(ids), str(ids[0])))
+
+# -------------------- CLI --------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate rules for batch review")
+    parser.add_argument("rules", help="rule file (.json array or .jsonl)")
+    parser.add_argument("--threshold", type=float, default=0.5, help="minimum estimated Jaccard similarity")
+    parser.add_argument("--bands", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=3, help="signature rows per LSH band")
+    parser.add_argument("--output", help="write the clusters as JSON here")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    rules = list(iter_rules(args.rules))
+    clusters = cluster_rules(rules, threshold=args.threshold, bands=args.bands, rows=args.rows)
+    elapsed = time.time() - started
+
+    for ids in clusters:
+        if len(ids) > 1:
+            print(f"{len(ids):>5}  {', '.join(map(str, ids[:10]))}{' ...' if len(ids) > 10 else ''}")
+    print(f"{len(rules)} rules -> {len(clusters)} clusters in {elapsed:.1f}s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump([{"representative": ids[0], "size": len(ids), "rule_ids": ids} for ids in clusters], f, indent=4)
+
+if __name__ == "__main__":
+    main()
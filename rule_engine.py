@@ -0,0 +1,458 @@
+# rule_engine.py
+# Runs the rules in data/input.json against command lines and reports, per rule, how many
+# lines its pattern matches and whether `pattern` + `replace` turns `original` into `normalized`.
+#
+#   python rule_engine.py data/input.json                    # lines from the arguments table
+#   python rule_engine.py data/input.json --lines cmds.txt   # lines from a text file
+#   python rule_engine.py data/input.json --output report.json
+#   python rule_engine.py data/input.json --benchmark        # prefilter vs. brute force
+#   python rule_engine.py data/input.json --workers 8        # batches scanned on 8 processes
+#   python rule_engine.py data/input.json --state rules.state.json   # only re-check what changed
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:   # Python < 3.11
+    import sre_parse, sre_constants
+
+from db import iter_argument_lines
+from importer import iter_rules
+
+SAMPLE_SIZE = 3   # argument ids kept per rule as examples of what it matched
+
+# -------------------- Rules --------------------
+
+@lru_cache(maxsize=None)
+def compile_pattern(pattern):
+    """Compiled regex for `pattern`; rules sharing a pattern share one compiled object."""
+    return re.compile(pattern)
+
+class Rule:
+    __slots__ = ("id", "command", "pattern", "replace", "original", "normalized", "regex", "error")
+
+    def __init__(self, data):
+        self.id = data.get("id")
+        self.command = data.get("command")
+        self.pattern = data.get("pattern") or ""
+        self.replace = data.get("replace") or ""
+        self.original = data.get("original") or ""
+        self.normalized = data.get("normalized") or ""
+        self.error = None
+        try:
+            self.regex = compile_pattern(self.pattern)
+        except re.error as e:
+            self.regex = None
+            self.error = f"bad pattern: {e}"
+
+    def check_replace(self):
+        """(ok, produced): does applying the rule to its own `original` give `normalized`?"""
+        if self.regex is None:
+            return False, None
+        if not self.regex.search(self.original):
+            return False, None
+        try:
+            produced = self.regex.sub(self.replace, self.original)
+        except (re.error, IndexError) as e:
+            self.error = f"bad replace: {e}"
+            return False, None
+        return produced == self.normalized, produced
+
+def rule_hash(rule):
+    """Fingerprint of everything that affects a rule's result."""
+    text = "\x1f".join((rule.pattern, rule.replace, rule.original, rule.normalized))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def load_rules(path):
+    return [Rule(data) for data in iter_rules(path)]
+
+# -------------------- Prefilter --------------------
+
+_WORD = re.compile(r"\w+")
+_WORD_CHAR = re.compile(r"\w")
+_SEPARATOR_CATEGORIES = {sre_constants.CATEGORY_SPACE, sre_constants.CATEGORY_NOT_WORD}
+
+def _is_separator(item):
+    """True when the parsed node always matches exactly non-word characters."""
+    if len(item) != 1:
+        return False
+    op, av = item[0]
+    if op == sre_constants.LITERAL:
+        return not _WORD_CHAR.match(chr(av))
+    if op == sre_constants.IN:
+        return all(
+            (kind == sre_constants.LITERAL and not _WORD_CHAR.match(chr(value)))
+            or (kind == sre_constants.CATEGORY and value in _SEPARATOR_CATEGORIES)
+            for kind, value in av
+        )
+    return False
+
+def _flatten(parsed, out):
+    """Mandatory top-level sequence as ("lit", ch) / ("sep", None) / ("any", None) items."""
+    for op, av in parsed:
+        if op == sre_constants.LITERAL:
+            ch = chr(av)
+            out.append(("lit", ch) if _WORD_CHAR.match(ch) else ("sep", None))
+        elif op == sre_constants.SUBPATTERN and not av[1] & sre_constants.SRE_FLAG_IGNORECASE:
+            _flatten(av[3], out)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1 and _is_separator(av[2]):
+            out.append(("sep", None))
+        elif op == sre_constants.IN and _is_separator([(op, av)]):
+            out.append(("sep", None))
+        else:
+            out.append(("any", None))
+    return out
+
+def required_tokens(pattern):
+    """
+    Whole words every match of `pattern` must contain: literal word runs with a guaranteed
+    non-word character on both sides (e.g. `main_dlg_cur` in "\\s+`main_dlg_cur`\\s+").
+    A matching line therefore has each of them as one of its \\w+ tokens. Empty when
+    nothing can be proven (case-insensitive patterns, alternations, ...).
+    """
+    parsed = sre_parse.parse(pattern)
+    if parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return set()
+    tokens = set()
+    word = None          # current literal word, or None when its left edge is not a separator
+    after_sep = False
+    for kind, ch in _flatten(parsed, []):
+        if kind == "lit":
+            if word is not None:
+                word += ch
+            elif after_sep:
+                word = ch
+            after_sep = False
+        else:
+            if kind == "sep" and word:
+                tokens.add(word)
+            word = None
+            after_sep = kind == "sep"
+    return tokens
+
+class Prefilter:
+    """
+    Maps each rule to its rarest required token (across the rule set), so a line only runs
+    the regexes of rules whose token it contains, plus the rules with no usable token.
+    """
+
+    def __init__(self, rules):
+        rule_tokens = [required_tokens(rule.pattern) for rule in rules]
+        frequency = {}
+        for tokens in rule_tokens:
+            for token in tokens:
+                frequency[token] = frequency.get(token, 0) + 1
+
+        self.buckets = {}
+        fallback = []
+        for i, tokens in enumerate(rule_tokens):
+            if tokens:
+                key = min(tokens, key=lambda t: (frequency[t], -len(t), t))
+                self.buckets.setdefault(key, []).append(i)
+            else:
+                fallback.append(i)
+        self.fallback = fallback
+
+    def candidates(self, line):
+        """Indexes of the rules that can match `line`, ascending."""
+        buckets = self.buckets
+        found = list(self.fallback)
+        for token in set(_WORD.findall(line)):
+            bucket = buckets.get(token)
+            if bucket:
+                found.extend(bucket)
+        found.sort()
+        return found
+
+# -------------------- Matching --------------------
+
+class RuleSet:
+    """The compiled rules plus per-rule match counters for one scan."""
+
+    def __init__(self, rules, prefilter=True):
+        self.rules = [rule for rule in rules if rule.regex is not None]
+        self.prefilter = Prefilter(self.rules) if prefilter else None
+        self.reset()
+
+    def reset(self):
+        self.matches = [0] * len(self.rules)
+        self.samples = [[] for _ in self.rules]
+        self.lines = 0
+        self.evaluated = 0   # regex searches actually run
+
+    def scan(self, batch):
+        """Counts matches for a batch of (argument_id, full_command_line)."""
+        rules = self.rules
+        matches = self.matches
+        samples = self.samples
+        prefilter = self.prefilter
+        everything = range(len(rules))
+        for arg_id, line in batch:
+            if not line:
+                continue
+            candidates = prefilter.candidates(line) if prefilter else everything
+            self.evaluated += len(candidates)
+            for i in candidates:
+                if rules[i].regex.search(line):
+                    matches[i] += 1
+                    if len(samples[i]) < SAMPLE_SIZE:
+                        samples[i].append(arg_id)
+        self.lines += len(batch)
+
+    def merge(self, matches, samples, lines, evaluated):
+        """Adds the counters of a scan done elsewhere; merge batches in scan order for stable samples."""
+        for i, n in enumerate(matches):
+            self.matches[i] += n
+            room = SAMPLE_SIZE - len(self.samples[i])
+            if room > 0 and samples[i]:
+                self.samples[i].extend(samples[i][:room])
+        self.lines += lines
+        self.evaluated += evaluated
+
+    def counts(self):
+        return {rule.id: (self.matches[i], list(self.samples[i])) for i, rule in enumerate(self.rules)}
+
+def iter_file_lines(path, batch_size, after_id=0):
+    """Batches of (line_number, text) from a plain text file, one command line per line."""
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if number <= after_id:
+                continue
+            batch.append((number, line.rstrip("\n")))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+# -------------------- Worker processes --------------------
+
+_worker_ruleset = None
+
+def _init_worker(rules, prefilter):
+    # runs once per process: the rules are unpickled and the prefilter built a single time
+    global _worker_ruleset
+    _worker_ruleset = RuleSet(rules, prefilter=prefilter)
+
+def _scan_batch(batch):
+    ruleset = _worker_ruleset
+    ruleset.reset()
+    ruleset.scan(batch)
+    return ruleset.matches, ruleset.samples, ruleset.lines, ruleset.evaluated
+
+def scan_parallel(ruleset, batches, workers):
+    """
+    Scans batches on `workers` processes and merges their counters into `ruleset` in batch
+    order, so the result is identical to a single-process scan. At most 2 batches per
+    worker are in flight, keeping memory flat however large the corpus is.
+    """
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(ruleset.rules, ruleset.prefilter is not None)) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(_scan_batch, batch))
+            if len(pending) >= 2 * workers:
+                ruleset.merge(*pending.popleft().result())
+        while pending:
+            ruleset.merge(*pending.popleft().result())
+    return ruleset
+
+# -------------------- Report --------------------
+
+def build_report(rules, counts):
+    report = []
+    for rule in rules:
+        ok, produced = rule.check_replace()
+        matched, samples = counts.get(rule.id, (0, []))
+        report.append({
+            "id": rule.id,
+            "command": rule.command,
+            "matches": matched,
+            "sample_ids": samples,
+            "replace_ok": ok,
+            "produced": produced,
+            "error": rule.error,
+        })
+    return report
+
+def print_report(report, lines, elapsed):
+    print(f"{'rule':<12} {'matches':>9}  replace")
+    for row in report:
+        status = "ok" if row["replace_ok"] else (row["error"] or f"got {row['produced']!r}")
+        print(f"{str(row['id']):<12} {row['matches']:>9}  {status}")
+    print(f"{len(report)} rules x {lines} lines in {elapsed:.1f}s ({lines / max(elapsed, 1e-6):.0f} lines/s)")
+
+def _scan(rules, batches, prefilter, workers):
+    ruleset = RuleSet(rules, prefilter=prefilter)
+    if workers > 1:
+        scan_parallel(ruleset, batches, workers)
+    else:
+        for batch in batches:
+            ruleset.scan(batch)
+    return ruleset
+
+def validate(rules, batches, prefilter=True, workers=1):
+    """Scans every batch with the compiled rules; returns (report, lines scanned)."""
+    ruleset = _scan(rules, batches, prefilter, workers)
+    return build_report(rules, ruleset.counts()), ruleset.lines
+
+# -------------------- Incremental runs --------------------
+
+def load_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print("Error reading rule state, starting over:", e)
+        return {}
+
+def save_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def _track(batches, seen, upto=None):
+    """Passes batches through, recording the highest line id; stops after `upto` when given."""
+    for batch in batches:
+        if upto is not None:
+            batch = [row for row in batch if row[0] <= upto]
+            if not batch:
+                return
+        seen["last_id"] = max(seen["last_id"], batch[-1][0])
+        yield batch
+
+def validate_incremental(rules, open_batches, state_path, source, prefilter=True, workers=1, full=False):
+    """
+    Re-checks only the delta since the previous run recorded in `state_path`:
+    rules whose pattern/replace/original/normalized hash changed (or are new) are scanned
+    over every line, unchanged rules only over lines with ids above the stored high-water
+    mark, and their stored counts are carried forward. `open_batches(after_id)` yields line
+    batches in id order. Lines edited or deleted in place are not noticed; use full=True.
+
+    Returns (report, lines scanned, rules re-checked).
+    """
+    state = {} if full else load_state(state_path)
+    if state.get("source") != source:
+        state = {}
+    previous = state.get("rules", {})
+    last_id = state.get("last_line_id", 0)
+
+    hashes = {rule.id: rule_hash(rule) for rule in rules}
+    changed = [rule for rule in rules if previous.get(rule.id, {}).get("hash") != hashes[rule.id]]
+    changed_ids = {rule.id for rule in changed}
+    unchanged = [rule for rule in rules if rule.id not in changed_ids]
+
+    seen = {"last_id": last_id}
+    lines = 0
+    entries = {}
+    upto = None
+    if changed:
+        ruleset = _scan(changed, _track(open_batches(0), seen), prefilter, workers)
+        lines += ruleset.lines
+        for entry in build_report(changed, ruleset.counts()):
+            entries[entry["id"]] = entry
+        # new lines that arrive during this run are left for the next one, for every rule
+        upto = seen["last_id"]
+    if unchanged:
+        ruleset = _scan(unchanged, _track(open_batches(last_id), seen, upto), prefilter, workers)
+        lines += ruleset.lines
+        counts = ruleset.counts()
+        for rule in unchanged:
+            matched, samples = counts.get(rule.id, (0, []))
+            rule_id = rule.id
+            entry = dict(previous[rule_id])
+            entry.pop("hash", None)
+            entry["matches"] += matched
+            entry["sample_ids"] = (entry["sample_ids"] + samples)[:SAMPLE_SIZE]
+            entries[rule_id] = entry
+
+    report = [entries[rule.id] for rule in rules if rule.id in entries]
+    save_state(state_path, {
+        "source": source,
+        "last_line_id": seen["last_id"],
+        "rules": {entry["id"]: dict(entry, hash=hashes[entry["id"]]) for entry in report},
+    })
+    return report, lines, len(changed)
+
+def benchmark(rules, batches):
+    """Times brute force against the prefilter on the same lines and checks they agree."""
+    batches = list(batches)
+    timings = {}
+    for mode in (False, True):
+        ruleset = RuleSet(rules, prefilter=mode)
+        started = time.perf_counter()
+        for batch in batches:
+            ruleset.scan(batch)
+        timings[mode] = (time.perf_counter() - started, ruleset)
+
+    (brute_s, brute), (fast_s, fast) = timings[False], timings[True]
+    lines = max(brute.lines, 1)
+    print(f"{len(brute.rules)} rules x {brute.lines} lines "
+          f"({len(fast.prefilter.buckets)} token buckets, {len(fast.prefilter.fallback)} unindexed rules)")
+    print(f"  brute force: {brute_s:.3f}s, {brute.evaluated / lines:.1f} regex searches/line")
+    print(f"  prefilter:   {fast_s:.3f}s, {fast.evaluated / lines:.1f} regex searches/line "
+          f"({brute_s / max(fast_s, 1e-9):.1f}x)")
+    if brute.counts() != fast.counts():
+        print("  MISMATCH: prefilter and brute force disagree")
+        return False
+    print("  results identical")
+    return True
+
+# -------------------- CLI --------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate rule patterns against command lines")
+    parser.add_argument("rules", help="rule file (.json array or .jsonl)")
+    parser.add_argument("--lines", help="text file of command lines; default: the arguments table")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--output", help="write the report as JSON here")
+    parser.add_argument("--no-prefilter", action="store_true", help="run every rule on every line")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare the prefilter with brute force (loads all lines into memory)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes to scan with (0 = one per CPU); output does not depend on it")
+    parser.add_argument("--state", help="results of the previous run; only changed rules and new lines are scanned")
+    parser.add_argument("--full", action="store_true", help="with --state: ignore the saved results and rescan everything")
+    args = parser.parse_args(argv)
+
+    rules = load_rules(args.rules)
+    batches = (iter_file_lines(args.lines, args.batch_size) if args.lines
+               else iter_argument_lines(batch_size=args.batch_size))
+    if args.benchmark:
+        benchmark(rules, batches)
+        return
+    started = time.time()
+    workers = args.workers or os.cpu_count() or 1
+    if args.state:
+        if args.lines:
+            source = os.path.abspath(args.lines)
+            open_batches = lambda after_id: iter_file_lines(args.lines, args.batch_size, after_id)
+        else:
+            source = "arguments"
+            open_batches = lambda after_id: iter_argument_lines(after_id, args.batch_size)
+        report, lines, rechecked = validate_incremental(
+            rules, open_batches, args.state, source,
+            prefilter=not args.no_prefilter, workers=workers, full=args.full
+        )
+        print(f"{rechecked} of {len(rules)} rules re-checked")
+    else:
+        report, lines = validate(rules, batches, prefilter=not args.no_prefilter, workers=workers)
+    print_report(report, lines, time.time() - started)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+if __name__ == "__main__":
+    main()
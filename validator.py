@@ -1,9 +1,10 @@
 
 # validator.py
 import streamlit as st
-from db import signup_user, login_user, get_last_processed_cmd_id
+from db import signup_user, login_user, init_schema, get_user
 
 st.set_page_config(page_title="Command Classifier", layout="wide")
+init_schema()
 
 # -------------------- Session State --------------------
 if "logged_in" not in st.session_state:
@@ -39,12 +40,13 @@ def login():
             # Persist session
             st.session_state.logged_in = True
             st.session_state.user = user
+            # history pages cached by an earlier login in this browser session are not theirs
+            st.session_state.pop("history_pages", None)
 
             # Initialize validator-specific state at login
             if login_type == "Validator":
-                st.session_state.current_index = get_last_processed_cmd_id(user["id"]) or 0
-                # reset dashboard caches to force fresh load
-                st.session_state.pop("cmds_data", None)
+                # reset dashboard caches to force fresh load (resumes from the saved cursor)
+                st.session_state.pop("queue", None)
                 st.session_state.pop("sub_idx", None)
 
             st.rerun()
@@ -60,7 +62,14 @@ if not st.session_state.logged_in:
     else:
         signup()
 else:
-    role = st.session_state.user["role"].lower()
+    # re-read the profile (cached, see db.get_user) so role changes apply without re-login
+    profile = get_user(st.session_state.user["id"])
+    if profile is None:
+        st.session_state.logged_in = False
+        st.session_state.user = None
+        st.rerun()
+    st.session_state.user = profile
+    role = profile["role"].lower()
 
     if role == "admin":
         import admin_dashboard
@@ -2,13 +2,14 @@ import streamlit as st
 import html
 from datetime import datetime, date, time, timedelta
 
+import db
+from config import QUEUE_PREFETCH, CORPUS_CACHE_ENABLED, HISTORY_PAGE_SIZE, HISTORY_CACHED_FILTERS
+from corpus_cache import get_corpus, get_command_contexts
 from db import (
-    get_commands_with_contexts,
-    insert_dynamic_command,
-    insert_static_command,
-    update_last_processed_cmd,
-    get_connection,  # used for history/details queries
+    get_resume_command_id,
+    connection,  # used for history/details queries
 )
+from write_queue import record_classification, flush_writes
 
 # -------------------- Style (Light CSS) --------------------
 _DEF_CSS = """
@@ -16,25 +17,6 @@ _DEF_CSS = """
 /* Headings */
 .h-center { text-align:center; }
 
-/* Badge pills for Dynamic/Static */
-.badge {
-  display:inline-block; padding:4px 10px; border-radius:12px;
-  font-size:12px; font-weight:600; color:white;
-}
-.badge-dyn { background:#1f8e3d; }
-.badge-stat{ background:#1a73e8; }
-
-/* Zebra rows */
-.row-wrap { padding:8px 10px; border-radius:8px; }
-.row-wrap:nth-child(odd)  { background:#fafafa; }
-.row-wrap:nth-child(even) { background:#f3f6fc; }
-
-/* Table header */
-.header-row {
-  padding:10px 10px; border-radius:8px; background:#e9efff;
-  font-weight:700;
-}
-
 /* Context panel */
 .context-box {
   background-color:#f0f2f6; padding:20px 25px; border-radius:10px;
@@ -48,14 +30,18 @@ _DEF_CSS = """
 """
 
 # -------------------- Helpers & State --------------------
-def _ensure_state():
-    # Load data only when needed
-    if "cmds_data" not in st.session_state:
-        st.session_state.cmds_data = get_commands_with_contexts()
-    if "current_index" not in st.session_state:
-        st.session_state.current_index = 0
+def _ensure_state(user):
     if "sub_idx" not in st.session_state:
         st.session_state.sub_idx = {}
+    # Load only a window of commands around the current position
+    if "queue" not in st.session_state:
+        st.session_state.queue = {"ids": [], "pos": {}, "rows": {}, "current": None,
+                                  "more_before": False, "more_after": False}
+        # the resume point is read from MySQL, so let queued clicks land first
+        flush_writes(timeout=5)
+        start_id = get_resume_command_id(user["id"])
+        if start_id is not None:
+            _queue_goto(start_id)
 
     # Navigation state: "dashboard" | "history"
     if "nav" not in st.session_state:
@@ -69,16 +55,61 @@ def _ensure_state():
             "command_id": "",
             "type": "All",           # All | Dynamic | Static
         }
-    if "history_rows" not in st.session_state:
-        st.session_state.history_rows = []
+    if "history_query" not in st.session_state:
+        st.session_state.history_query = (None, None, None, "All")  # (start_dt, end_dt, cmd_id, type)
+    if "history_pages" not in st.session_state:
+        st.session_state.history_pages = {}  # (user_id, filter tuple) -> {"rows": [...], "cursor": ...}
     if "history_selected" not in st.session_state:
         st.session_state.history_selected = None
     if "history_details" not in st.session_state:
         st.session_state.history_details = []
     if "history_mode" not in st.session_state:
         st.session_state.history_mode = "list"  # list | detail
-    if "history_loaded" not in st.session_state:
-        st.session_state.history_loaded = False  # to load all by default
+
+def _queue_source():
+    """The shared in-process corpus snapshot, or MySQL keyset queries when the cache is disabled."""
+    return get_corpus() if CORPUS_CACHE_ENABLED else db
+
+def _queue_goto(cmd_id):
+    """
+    Makes `cmd_id` the current command. The session only holds the command ids and
+    arguments/contexts within QUEUE_PREFETCH commands of it (references into the shared corpus
+    snapshot when the cache is on); the window is refilled, reusing rows already loaded,
+    whenever the current command reaches its edge.
+    """
+    q = st.session_state.queue
+    if cmd_id in q["rows"]:
+        pos = q["pos"][cmd_id]
+        at_edge = (pos == 0 and q["more_before"]) or (pos == len(q["ids"]) - 1 and q["more_after"])
+        if not at_edge:
+            q["current"] = cmd_id
+            return
+
+    source = _queue_source()
+    before = source.get_command_ids_before(cmd_id, QUEUE_PREFETCH)
+    after = source.get_command_ids_from(cmd_id, QUEUE_PREFETCH + 1)
+    ids = before + after
+    rows = {i: q["rows"][i] for i in ids if i in q["rows"]}
+    rows.update(source.get_command_arguments([i for i in ids if i not in rows]))
+
+    q.update(
+        ids=ids,
+        pos={i: n for n, i in enumerate(ids)},
+        rows=rows,
+        current=after[0] if after else None,  # cmd_id itself may have been removed
+        more_before=len(before) == QUEUE_PREFETCH,
+        more_after=len(after) == QUEUE_PREFETCH + 1,
+    )
+    st.session_state.sub_idx = {i: n for i, n in st.session_state.sub_idx.items() if i in rows}
+
+def _queue_step(step):
+    """Moves `step` commands forward/back. Returns False when there is no such command."""
+    q = st.session_state.queue
+    pos = q["pos"][q["current"]] + step
+    if pos < 0 or pos >= len(q["ids"]):
+        return False
+    _queue_goto(q["ids"][pos])
+    return True
 
 def _set_nav(target: str):
     st.session_state.nav = target
@@ -108,57 +139,43 @@ def _navbar():
         st.rerun()
 
 # -------------------- Data Access for History --------------------
-def _user_table_name(base: str, user_id: int) -> str:
-    if not isinstance(user_id, int):
-        raise ValueError("user_id must be an integer")
-    return f"{base}_{user_id}"
-
-import streamlit as st
-from db import get_connection
-
 def render_history_for_user(user):
     st.markdown(f"🧑‍💻 Showing history for: {user['name']}")
     
     user_id = user["id"]
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    # Dynamic commands
-    cursor.execute(f"""
-        SELECT * FROM dynamic_cmds_user_{user_id}
-        ORDER BY processed_time ASC
-    """)
-    dynamic_rows = cursor.fetchall()
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT command_id, command_text, action, processed_time
+            FROM classifications
+            WHERE user_id = %s
+            ORDER BY processed_time ASC
+        """, (user_id,))
+        rows = cursor.fetchall()
+        cursor.close()
+
+    dynamic_rows = [r for r in rows if r["action"] == "Dynamic"]
+    static_rows = [r for r in rows if r["action"] == "Static"]
     
     if dynamic_rows:
         st.markdown("🔥 Dynamic Commands")
         for row in dynamic_rows:
-            cmd_id = row["id"]
+            cmd_id = row["command_id"]
             cmd_text = row["command_text"]
             proc_time = row["processed_time"].strftime("%Y-%m-%d %H:%M:%S")
             st.markdown(f"🟢 {cmd_id}: ~ {cmd_text}`` ⏱️ {proc_time}")
     else:
         st.info("No dynamic commands found.")
 
-    # Static commands
-    cursor.execute(f"""
-        SELECT * FROM static_cmds_user_{user_id}
-        ORDER BY processed_time ASC
-    """)
-    static_rows = cursor.fetchall()
-
     if static_rows:
         st.markdown("📦 Static Commands")
         for row in static_rows:
-            cmd_id = row["id"]
+            cmd_id = row["command_id"]
             cmd_text = row["command_text"]
             proc_time = row["processed_time"].strftime("%Y-%m-%d %H:%M:%S")
             st.markdown(f"🟠 {cmd_id}: ~ {cmd_text}`` ⏱️ {proc_time}")
     else:
         st.info("No static commands found.")
-    
-    cursor.close()
-    conn.close()
 
 
 def fetch_user_history(
@@ -166,22 +183,21 @@ def fetch_user_history(
     start_dt: datetime | None,
     end_dt: datetime | None,
     cmd_id: int | None,
-    action_type: str = "All"  # "All" | "Dynamic" | "Static"
+    action_type: str = "All",  # "All" | "Dynamic" | "Static"
+    after: tuple | None = None,
+    limit: int = HISTORY_PAGE_SIZE,
 ):
     """
-    Returns list of dict rows:
-    { 'command_id': int, 'command_text': str, 'action': 'Dynamic'|'Static', 'processed_time': datetime }
-    Ascending by command_id then processed_time.
+    Returns one keyset page: (rows, next_cursor). rows are dicts
+    { 'id': int, 'command_id': int, 'command_text': str, 'action': 'Dynamic'|'Static', 'processed_time': datetime }
+    ascending by command_id, processed_time, id. Pass next_cursor back as `after` for the
+    following page; it is None on the last page. rows is None when the query failed.
     """
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        dyn_table = _user_table_name("dynamic_cmds_user", user_id)
-        sta_table = _user_table_name("static_cmds_user", user_id)
-
-        def where_parts():
-            clauses = []
-            params = []
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            clauses = ["user_id = %s"]
+            params = [user_id]
             if start_dt:
                 clauses.append("processed_time >= %s")
                 params.append(start_dt)
@@ -191,88 +207,92 @@ def fetch_user_history(
             if cmd_id is not None:
                 clauses.append("command_id = %s")
                 params.append(cmd_id)
-            return clauses, params
-
-        dyn_clauses, dyn_params = where_parts()
-        sta_clauses, sta_params = where_parts()
-
-        dyn_where = f"WHERE {' AND '.join(dyn_clauses)}" if dyn_clauses else ""
-        sta_where = f"WHERE {' AND '.join(sta_clauses)}" if sta_clauses else ""
-
-        selects = []
-        params_all = []
-
-        if action_type in ("All", "Dynamic"):
-            selects.append(f"SELECT command_id, command_text, 'Dynamic' AS action, processed_time FROM {dyn_table} {dyn_where}")
-            params_all.extend(dyn_params)
-        if action_type in ("All", "Static"):
-            selects.append(f"SELECT command_id, command_text, 'Static'  AS action, processed_time FROM {sta_table} {sta_where}")
-            params_all.extend(sta_params)
-
-        if not selects:
-            return []
-
-        union_query = " UNION ALL ".join(selects)
-        final_query = f"""
-            {union_query}
-            ORDER BY command_id ASC, processed_time ASC
-            LIMIT 2000
-        """
-        cursor.execute(final_query, params_all)
-        rows = cursor.fetchall()
-        return rows
-    except Exception as e:
-        print("Error in fetch_user_history:", e)
-        return []
-    finally:
-        cursor.close()
-        conn.close()
+            if action_type in ("Dynamic", "Static"):
+                clauses.append("action = %s")
+                params.append(action_type)
+            elif action_type != "All":
+                return [], None
+            if after is not None:
+                last_cmd, last_time, last_id = after
+                clauses.append("""(command_id > %s OR (command_id = %s AND
+                    (processed_time > %s OR (processed_time = %s AND id > %s))))""")
+                params.extend([last_cmd, last_cmd, last_time, last_time, last_id])
+
+            final_query = f"""
+                SELECT id, command_id, command_text, action, processed_time
+                FROM classifications
+                WHERE {' AND '.join(clauses)}
+                ORDER BY command_id ASC, processed_time ASC, id ASC
+                LIMIT %s
+            """
+            cursor.execute(final_query, (*params, limit + 1))
+            rows = cursor.fetchall()
+            if len(rows) <= limit:
+                return rows, None
+            rows = rows[:limit]
+            last = rows[-1]
+            return rows, (last["command_id"], last["processed_time"], last["id"])
+        except Exception as e:
+            print("Error in fetch_user_history:", e)
+            return None, None
+        finally:
+            cursor.close()
 
 def fetch_contexts_for_command(command_id: int):
     """
     Returns list of rows: [{'argument_id', 'command_id', 'full_command_line', 'context_lines'}]
+    Served from the shared context cache (see _history_prefetch_contexts).
     """
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
     try:
-        query = """
-            SELECT 
-                a.id AS argument_id,
-                c.id AS command_id,
-                a.full_command_line,
-                ctx.context_lines
-            FROM commands c
-            JOIN arguments a ON c.id = a.command_id
-            LEFT JOIN contexts ctx ON ctx.argument_id = a.id
-            WHERE c.id = %s
-            ORDER BY a.id;
-        """
-        cursor.execute(query, (command_id,))
-        results = cursor.fetchall()
-        # Normalize context lines
-        for row in results:
-            ctx = row.get("context_lines")
-            if ctx:
-                row["context_lines"] = ctx.replace("\\n", "\n").replace("\\\\", "\\")
-        return results
+        return list(get_command_contexts([command_id])[command_id])
     except Exception as e:
         print("Error in fetch_contexts_for_command:", e)
         return []
-    finally:
-        cursor.close()
-        conn.close()
+
+# -------------------- History page cache --------------------
+def _history_prefetch_contexts(rows):
+    """Warms the context cache for every command on a freshly fetched page with one IN query."""
+    try:
+        get_command_contexts([r["command_id"] for r in rows])
+    except Exception as e:
+        print("Error prefetching history contexts:", e)
+
+def _history_entry(user_id, query):
+    """
+    Pages fetched so far for one user and filter tuple; loads the first page on a miss.
+    Returns None when that load failed (nothing is cached, so the next run retries).
+    """
+    pages = st.session_state.history_pages
+    key = (user_id, query)  # admins browse several validators' histories in one session
+    entry = pages.pop(key, None)
+    if entry is None:
+        # clicks still in the write-behind queue would be missing from the cached first page
+        flush_writes(timeout=5)
+        rows, cursor = fetch_user_history(user_id, *query)
+        if rows is None:
+            return None
+        _history_prefetch_contexts(rows)
+        entry = {"rows": rows, "cursor": cursor}
+    pages[key] = entry  # most recently used last
+    while len(pages) > HISTORY_CACHED_FILTERS:
+        pages.pop(next(iter(pages)))
+    return entry
+
+def _history_load_more(user_id, query):
+    entry = st.session_state.history_pages[(user_id, query)]
+    rows, cursor = fetch_user_history(user_id, *query, after=entry["cursor"])
+    if rows is None:
+        return False
+    _history_prefetch_contexts(rows)
+    entry["rows"].extend(rows)
+    entry["cursor"] = cursor
+    return True
 
 # -------------------- History UI --------------------
 def _history_list_view(user):
     st.markdown(_DEF_CSS, unsafe_allow_html=True)
     st.markdown("<h1 class='h-center'> Processing History</h1>", unsafe_allow_html=True)
 
-    # Auto-load all history on first visit or after clear
-    if not st.session_state.history_loaded:
-        rows = fetch_user_history(user["id"], None, None, None, "All")
-        st.session_state.history_rows = rows
-        st.session_state.history_loaded = True
-
     # ----- Filters -----
     with st.expander(" Filters", expanded=True):
         col0, col1, col2, col3, col4 = st.columns([0.8, 1.2, 1.0, 1.0, 0.9])
@@ -326,8 +346,8 @@ def _history_list_view(user):
             st.session_state.history_selected = None
             st.session_state.history_details = []
             st.session_state.history_mode = "list"
-            st.session_state.history_loaded = True  # prevent auto reload loop
-            st.session_state.history_rows = fetch_user_history(user["id"], None, None, None, "All")
+            st.session_state.history_query = (None, None, None, "All")
+            st.session_state.pop("history_table", None)
             st.rerun()
 
         if apply_clicked:
@@ -354,70 +374,67 @@ def _history_list_view(user):
                 "type": type_choice,
             }
 
-            rows = fetch_user_history(user["id"], start_dt, end_dt, cmd_id_val, type_choice)
-            st.session_state.history_rows = rows
+            st.session_state.history_query = (start_dt, end_dt, cmd_id_val, type_choice)
             st.session_state.history_selected = None
             st.session_state.history_details = []
             st.session_state.history_mode = "list"
-            st.session_state.history_loaded = True
+            st.session_state.pop("history_table", None)
             st.rerun()
 
-    rows = st.session_state.history_rows
+    # Served from the session page cache when this filter was already fetched
+    query = st.session_state.history_query
+    entry = _history_entry(user["id"], query)
+    if entry is None:
+        st.error("Could not load history. Try again with Apply.")
+        return
+    rows = entry["rows"]
 
     st.write("#### Actions")
-    st.caption("Click **View details** on any row to preview the command and all its contexts.")
-    
-    h1, h2, h3, h4, h5 = st.columns([0.8, 3.0, 1.0, 1.6, 1.2])
-
-# Shared styling for background and text
-    cell_style = "background-color:#D3D3D3; color:black; padding:8px; border-radius:4px; text-align:center;"
-
-    with h1:
-        st.markdown(f"<div class='header-row' style='{cell_style}'>ID</div>", unsafe_allow_html=True)
-    with h2:
-        st.markdown(f"<div class='header-row' style='{cell_style}'>Command</div>", unsafe_allow_html=True)
-    with h3:
-    # No background or text color applied to "Type"
-        st.markdown(f"<div class='header-row' style='{cell_style}'>Type</div>", unsafe_allow_html=True)
-    with h4:
-        st.markdown(f"<div class='header-row' style='{cell_style}'>Processed Time</div>", unsafe_allow_html=True)
-    with h5:
-        st.markdown(f"<div class='header-row' style='{cell_style}'>View details</div>", unsafe_allow_html=True)
-
-
-    st.write("")
+    st.caption("Select a row to preview the command and all its contexts. Click a column header to sort.")
 
     if not rows:
         st.info("No history found. Apply filters or add activity.")
         return
 
-    
-    cell_style = "background-color:#D3D3D3; color:black; padding:8px; border-radius:4px; text-align:center;"
-    for i, r in enumerate(rows):
-        c1, c2, c3, c4, c5 = st.columns([0.8, 3.0, 1.0, 1.6, 1.2])
-        with c1:
-            st.markdown(f"<div class='row-wrap' style='{cell_style}'>{r['command_id']}</div>", unsafe_allow_html=True)
-
-        with c2:
-            st.markdown(
-                f"<div class='row-wrap' style='{cell_style} white-space:nowrap; overflow:hidden; text-overflow:ellipsis;'>{html.escape(r.get('command_text', '') or '')}</div>",
-                unsafe_allow_html=True
-            )
-
-        with c3:
-            # Keep badge styling here for "Type" column
-            badge_cls = "badge-dyn" if r["action"] == "Dynamic" else "badge-stat"
-            st.markdown(f"<div class='row-wrap'><span class='badge {badge_cls}'>{r['action']}</span></div>", unsafe_allow_html=True)
-
-        with c4:
-            st.markdown(f"<div class='row-wrap' style='{cell_style}'>{r['processed_time']}</div>", unsafe_allow_html=True)
-        with c5:
-            if st.button("  View details", key=f"view_details_{i}_{r['command_id']}_{r['action']}"):
-                # Store selection and load details; switch to detail mode
-                st.session_state.history_selected = r
-                st.session_state.history_details = fetch_contexts_for_command(r["command_id"])
-                st.session_state.history_mode = "detail"
+    # One virtualized grid widget: only visible rows are drawn, sorting happens in the browser
+    event = st.dataframe(
+        [
+            {
+                "ID": r["command_id"],
+                "Command": r.get("command_text") or "",
+                "Type": r["action"],
+                "Processed Time": r["processed_time"],
+            }
+            for r in rows
+        ],
+        key="history_table",
+        hide_index=True,
+        use_container_width=True,
+        height=480,
+        on_select="rerun",
+        selection_mode="single-row",
+        column_config={
+            "ID": st.column_config.NumberColumn("ID", width="small", format="%d"),
+            "Command": st.column_config.TextColumn("Command", width="large"),
+            "Type": st.column_config.TextColumn("Type", width="small"),
+            "Processed Time": st.column_config.DatetimeColumn("Processed Time", format="YYYY-MM-DD HH:mm:ss"),
+        },
+    )
+
+    selected = event.selection.rows  # positions in `rows`, unaffected by client-side sorting
+    if selected:
+        r = rows[selected[0]]
+        # Store selection and load details; switch to detail mode
+        st.session_state.history_selected = r
+        st.session_state.history_details = fetch_contexts_for_command(r["command_id"])
+        st.session_state.history_mode = "detail"
+        st.rerun()
+
+    if entry["cursor"] is not None:
+        if st.button(f"⬇️ Load more ({len(rows)} shown)", key="btn_history_load_more"):
+            if _history_load_more(user["id"], query):
                 st.rerun()
+            st.error("Could not load more history. Try again.")
 
 def _history_detail_view():
     """Renders the details view (hides filters and list)."""
@@ -426,6 +443,7 @@ def _history_detail_view():
     # Back button
     if st.button("⬅ Back to History", key="btn_back_to_history"):
         st.session_state.history_mode = "list"
+        st.session_state.pop("history_table", None)  # drop the row selection that opened this view
         st.rerun()
 
     sel = st.session_state.history_selected
@@ -454,11 +472,11 @@ def _history_detail_view():
     st.markdown("**Context Lines (Grouped by Arguments):**")
 
     for idx, arg in enumerate(details, start=1):
-        ctx_lines = arg.get("context_lines", "")
+        ctx_lines = arg.get("context_lines") or ""
         if not ctx_lines.strip():
             continue
 
-        clean_ctx = html.escape(ctx_lines.replace("\\n", "\n").replace("\\\\", "\\").strip())
+        clean_ctx = html.escape(ctx_lines.strip())
         full_cmd = html.escape(arg.get("full_command_line", "") or "")
 
         st.markdown(
@@ -487,21 +505,14 @@ def _history_view(user):
 def _dashboard_view(user):
     st.markdown("<h1 class='h-center'> Command Context Classifier</h1>", unsafe_allow_html=True)
 
-    all_data = st.session_state.cmds_data
-    grouped = {}
-    for row in all_data:
-        cmd_id = row["command_id"]
-        grouped.setdefault(cmd_id, []).append(row)
-
-    cmd_ids = list(grouped.keys())
-    idx = st.session_state.current_index
+    q = st.session_state.queue
 
-    if idx >= len(cmd_ids):
+    if q["current"] is None:
         st.success("🎉 All commands reviewed!")
         return
 
-    cmd_id = cmd_ids[idx]
-    arg_list = grouped[cmd_id]
+    cmd_id = q["current"]
+    arg_list = q["rows"][cmd_id]
 
     sub_idx = st.session_state.sub_idx.get(cmd_id, 0)
     if sub_idx >= len(arg_list):
@@ -542,17 +553,20 @@ def _dashboard_view(user):
 
     with col_dyn:
         if st.button("✅ Mark as Dynamic", key=f"btn_mark_dyn_{cmd_id}_{sub_idx}"):
-            insert_dynamic_command(user["id"], cmd_id, argument['full_command_line'])
-            # NOTE: This uses the same index-based progression you already use
-            update_last_processed_cmd(user["id"], idx + 1)
-            st.session_state.current_index += 1
+            record_classification(user["id"], cmd_id, argument["argument_id"],
+                                  argument['full_command_line'], "Dynamic")
+            st.session_state.history_pages = {}
+            if not _queue_step(1):
+                st.session_state.queue["current"] = None
             st.rerun()
 
     with col_stat:
         if st.button("✅ Mark as Static", key=f"btn_mark_stat_{cmd_id}_{sub_idx}"):
-            insert_static_command(user["id"], cmd_id, argument['full_command_line'])
-            update_last_processed_cmd(user["id"], idx + 1)
-            st.session_state.current_index += 1
+            record_classification(user["id"], cmd_id, argument["argument_id"],
+                                  argument['full_command_line'], "Static")
+            st.session_state.history_pages = {}
+            if not _queue_step(1):
+                st.session_state.queue["current"] = None
             st.rerun()
 
     # Navigation between commands
@@ -560,17 +574,15 @@ def _dashboard_view(user):
 
     with col1:
         if st.button("⬅️ Previous Command", key=f"btn_prev_cmd_{cmd_id}"):
-            st.session_state.current_index = max(0, idx - 1)
-            # Reset sub_idx for the new command view
-            new_cmd_id = cmd_ids[st.session_state.current_index]
-            st.session_state.sub_idx[new_cmd_id] = 0
+            if _queue_step(-1):
+                # Reset sub_idx for the new command view
+                st.session_state.sub_idx[st.session_state.queue["current"]] = 0
             st.rerun()
 
     with col2:
         if st.button("➡️ Next Command", key=f"btn_next_cmd_{cmd_id}"):
-            st.session_state.current_index = min(len(cmd_ids) - 1, idx + 1)
-            new_cmd_id = cmd_ids[st.session_state.current_index]
-            st.session_state.sub_idx[new_cmd_id] = 0
+            if _queue_step(1):
+                st.session_state.sub_idx[st.session_state.queue["current"]] = 0
             st.rerun()
 
 # -------------------- Entry --------------------
@@ -580,7 +592,7 @@ def validator_dashboard():
         st.warning("Unauthorized or invalid role.")
         return
 
-    _ensure_state()
+    _ensure_state(user)
     _navbar()
 
     if st.session_state.nav == "history":
@@ -0,0 +1,324 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+import mysql.connector
+
+from config import (
+    WRITE_BEHIND_ENABLED, WRITE_BEHIND_WAL, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL,
+)
+import db
+from events import CLASSIFIED, publish
+
+# Errors MySQL raises for the data of some event in the batch; the batch is split to find it.
+# Anything else (lost connection, deadlock, pool timeout, a schema mismatch, a bug in the
+# writer, ...) is not the events' fault: the whole batch is kept and retried, never rejected.
+_BAD_EVENT = (mysql.connector.IntegrityError, mysql.connector.DataError)
+_MAX_BACKOFF = 30.0
+
+
+class WriteBehindQueue:
+    """
+    Durable write-behind queue for classification clicks.
+
+    put() appends the event to a local WAL file (flushed and fsynced) and returns; a
+    background thread writes pending events to MySQL `batch_size` at a time through
+    `writer` and then drops them from the WAL. DB errors are retried with backoff; when
+    the data of an event is rejected, the batch is bisected so only that event is moved
+    to `<wal>.rejected` and the rest are written.
+    Events left in the WAL by a crash are replayed on start; `writer` skips events
+    that were already stored, so replay never double-counts.
+    """
+
+    def __init__(self, wal_path, writer, batch_size=500, flush_interval=1.0):
+        self._wal_path = wal_path
+        self.rejected_path = wal_path + ".rejected"
+        self._writer = writer
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._wal = None
+        self._thread = None
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,        # rows inserted
+            "skipped": 0,        # events found already stored (replays / retries)
+            "batches": 0,
+            "errors": 0,         # failed flush attempts (retried)
+            "rejected": 0,       # events moved to the .rejected file
+            "flush_time": 0.0,
+            "last_flush_ms": 0.0,
+            "last_error": None,
+            "replayed": 0,
+        }
+
+    # ---------------------- WAL ------------------------
+
+    @staticmethod
+    def _encode(event):
+        return json.dumps(dict(event, processed_time=event["processed_time"].isoformat())) + "\n"
+
+    @staticmethod
+    def _decode(line):
+        event = json.loads(line)
+        event["processed_time"] = datetime.fromisoformat(event["processed_time"])
+        return event
+
+    def _append_wal(self, lines):
+        self._wal.write("".join(lines))
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+
+    def _rewrite_wal(self):
+        """Replaces the WAL with the still-pending events (caller holds the lock)."""
+        self._wal.close()
+        tmp = self._wal_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(self._encode(e) for e in self._pending)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._wal_path)
+        self._wal = open(self._wal_path, "a", encoding="utf-8")
+
+    # ---------------------- lifecycle ------------------------
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            try:
+                with open(self._wal_path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            try:
+                                self._pending.append(self._decode(line))
+                            except ValueError:
+                                # torn last line from a crash mid-append: the click was never acknowledged
+                                pass
+            except FileNotFoundError:
+                pass
+            self._stats["replayed"] = len(self._pending)
+            self._wal = open(self._wal_path, "a", encoding="utf-8")
+            self._rewrite_wal()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def put(self, event, on_queued=None):
+        """
+        Appends the event to the WAL and the pending list. `on_queued(event)` runs under the
+        queue lock right after, so pending() never shows the event without it having run.
+        """
+        event = dict(event, event_id=event.get("event_id") or uuid.uuid4().hex)
+        with self._cond:
+            self._append_wal([self._encode(event)])
+            self._pending.append(event)
+            self._stats["enqueued"] += 1
+            if on_queued is not None:
+                on_queued(event)
+            if len(self._pending) >= self._batch_size:
+                self._cond.notify_all()
+        return event["event_id"]
+
+    def pending(self):
+        """Events not yet written (in click order)."""
+        with self._cond:
+            return list(self._pending)
+
+    def flush(self, timeout=None):
+        """Waits until everything queued so far is written; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # ---------------------- flusher ------------------------
+
+    def _write(self, batch):
+        """
+        (rows written, rejected events). Halves the batch on a data error until the bad
+        events are isolated; other errors propagate so the caller retries. Halves that were
+        already written are skipped by the writer on retry.
+        """
+        try:
+            return self._writer(batch), []
+        except _BAD_EVENT as e:
+            if len(batch) == 1:
+                print("Error writing classification, moving it to .rejected:", e)
+                with self._cond:
+                    self._stats["last_error"] = str(e)
+                return 0, batch
+        mid = len(batch) // 2
+        written_a, rejected_a = self._write(batch[:mid])
+        written_b, rejected_b = self._write(batch[mid:])
+        return written_a + written_b, rejected_a + rejected_b
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._cond:
+                if len(self._pending) < self._batch_size:
+                    self._cond.wait(self._flush_interval)
+                batch = [self._pending[i] for i in range(min(len(self._pending), self._batch_size))]
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            try:
+                written, rejected = self._write(batch)
+            except Exception as e:
+                failures += 1
+                print("Error flushing classifications, retrying:", e)
+                resume = time.monotonic() + min(_MAX_BACKOFF, 0.5 * 2 ** failures)
+                with self._cond:
+                    self._stats["errors"] += 1
+                    self._stats["last_error"] = str(e)
+                    # flush() notifies the condition; those wake-ups must not cut the backoff short
+                    remaining = resume - time.monotonic()
+                    while remaining > 0:
+                        self._cond.wait(remaining)
+                        remaining = resume - time.monotonic()
+                continue
+            failures = 0
+            elapsed = time.monotonic() - started
+            if rejected:
+                with open(self.rejected_path, "a", encoding="utf-8") as f:
+                    f.writelines(self._encode(ev) for ev in rejected)
+
+            with self._cond:
+                for _ in batch:
+                    self._pending.popleft()
+                self._rewrite_wal()
+                self._stats["rejected"] += len(rejected)
+                self._stats["batches"] += 1
+                self._stats["written"] += written
+                self._stats["skipped"] += len(batch) - len(rejected) - written
+                self._stats["flush_time"] += elapsed
+                self._stats["last_flush_ms"] = 1000 * elapsed
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["depth"] = len(self._pending)
+            stats["rejected_file"] = self.rejected_path
+            oldest = self._pending[0]["processed_time"] if self._pending else None
+        stats["oldest_pending_s"] = round((datetime.now() - oldest).total_seconds(), 1) if oldest else 0.0
+        stats["avg_flush_ms"] = 1000 * stats["flush_time"] / max(stats["batches"], 1)
+        return stats
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_write_queue():
+    """Process-wide queue, started (and its WAL replayed) on first use."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                queue = WriteBehindQueue(
+                    WRITE_BEHIND_WAL, db.write_classifications,
+                    batch_size=WRITE_BEHIND_BATCH_SIZE, flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+                )
+                queue.start()
+                _queue = queue
+    return _queue
+
+# Clicks being written synchronously (WRITE_BEHIND_ENABLED = False). They are committed
+# before they are published, so unsettled_classifications() must show them in between.
+_writing = {}   # (user_id, event_id) -> CLASSIFIED payload
+_writing_lock = threading.Lock()
+
+def _payload(event):
+    """CLASSIFIED payload of a click."""
+    return {
+        "event_id": event["event_id"],
+        "user_id": event["user_id"],
+        "command_id": event["command_id"],
+        "argument_id": event["argument_id"],
+        "action": event["action"],
+        "at": event["processed_time"],
+    }
+
+def _record(write, user_id, cmd_id, argument_id, command_text, action):
+    event = {
+        "event_id": uuid.uuid4().hex,
+        "user_id": user_id,
+        "command_id": cmd_id,
+        "argument_id": argument_id,
+        "command_text": command_text,
+        "action": action,
+        "processed_time": datetime.now(),
+    }
+    if WRITE_BEHIND_ENABLED:
+        db.update_last_seen(user_id)
+        # live admin views (live_stats.py, leaderboard.py) follow clicks as they are acknowledged
+        get_write_queue().put(event, on_queued=lambda e: publish(CLASSIFIED, **_payload(e)))
+        return
+
+    key = (user_id, event["event_id"])
+    with _writing_lock:
+        _writing[key] = _payload(event)
+    try:
+        write(event)
+        publish(CLASSIFIED, **_payload(event))
+    finally:
+        with _writing_lock:
+            _writing.pop(key, None)
+
+def record_classification(user_id, cmd_id, argument_id, command_text, action):
+    """
+    Same contract as db.record_classification, but returns as soon as the click is in the
+    local WAL; the row, counters and progress cursor reach MySQL with the next flush, and
+    last_seen with the next heartbeat flush.
+    """
+    _record(
+        lambda e: db.record_classification(user_id, cmd_id, argument_id, command_text, action,
+                                           e["event_id"], e["processed_time"]),
+        user_id, cmd_id, argument_id, command_text, action,
+    )
+
+def insert_dynamic_command(user_id, cmd_id, command_text, argument_id=None):
+    _record(
+        lambda e: db.insert_dynamic_command(user_id, cmd_id, command_text, argument_id,
+                                            e["event_id"], e["processed_time"]),
+        user_id, cmd_id, argument_id, command_text, "Dynamic",
+    )
+
+def insert_static_command(user_id, cmd_id, command_text, argument_id=None):
+    _record(
+        lambda e: db.insert_static_command(user_id, cmd_id, command_text, argument_id,
+                                           e["event_id"], e["processed_time"]),
+        user_id, cmd_id, argument_id, command_text, "Static",
+    )
+
+def unsettled_classifications():
+    """
+    (queued, writing) CLASSIFIED payloads: clicks acknowledged and published but maybe not in
+    MySQL yet, and clicks being written synchronously, maybe committed but not published yet.
+    """
+    queued = [_payload(e) for e in get_write_queue().pending()] if WRITE_BEHIND_ENABLED else []
+    with _writing_lock:
+        writing = list(_writing.values())
+    return queued, writing
+
+def flush_writes(timeout=None):
+    """Blocks until queued clicks are in MySQL (e.g. before reading a user's progress)."""
+    if WRITE_BEHIND_ENABLED:
+        return get_write_queue().flush(timeout)
+    return True
+
+def get_write_queue_stats():
+    if not WRITE_BEHIND_ENABLED:
+        return {"enabled": False}
+    return dict(get_write_queue().stats(), enabled=True)